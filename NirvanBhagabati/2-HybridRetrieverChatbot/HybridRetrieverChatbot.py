@@ -1,14 +1,23 @@
 import streamlit as st
 import google.generativeai as genai
 import os
+import sys
+import hashlib
 import requests, fitz  # Needed for PDF handling in app
 from llama_index.core.schema import Document
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.retrievers.bm25 import BM25Retriever
-from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core import VectorStoreIndex
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from llama_index.core.retrievers import QueryFusionRetriever
+from embedding_cache import CachedEmbedding
+from fusion_deadlines import ThreadSafeBM25Retriever
+from query_expansion import ExpandingFusionRetriever, make_query_expander
+from retrieval_cache import CachedRetriever, RetrievalCache, index_version
+from dense_retriever import NumpyDenseRetriever
+from context_budget import ContextPacker
+# Model discovery is shared with the other chatbots and lives in shared/ at the repo root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from shared.gemini_models import GeminiModelResolver
 import chromadb
 from llama_index.core import Settings
 from llama_index.llms.gemini import Gemini  # Import Gemini LLM
@@ -23,6 +32,29 @@ vector_store = ChromaVectorStore(chroma_collection=collection)
 ncert_url = "https://ncert.nic.in/textbook/pdf/leps101.pdf"
 pdf_path = "ncert.pdf"
 
+# How fused query variants are produced: "none" (the question only), "prf" (local, from the
+# corpus vocabulary) or "llm" (Gemini, cached on disk; PRF answers while the cache warms up).
+# Off by default: on the single-chapter PDF, PRF variants mostly add noise that RRF weighs like the question
+query_expansion = os.getenv("QUERY_EXPANSION", "none")
+
+# Seconds a resolved Gemini model name is reused before it is looked up again
+gemini_model_cache_ttl = float(os.getenv("GEMINI_MODEL_CACHE_TTL", str(24 * 3600)))
+
+# Dense retrieval backend: "chroma" (persistent vector store) or "numpy" (in-process brute force)
+dense_backend = os.getenv("DENSE_BACKEND", "chroma")
+
+# Seconds each retriever gets per fused query; late results are dropped from the fusion
+bm25_deadline = float(os.getenv("BM25_DEADLINE", "0.5"))
+vector_deadline = float(os.getenv("VECTOR_DEADLINE", "2.0"))
+
+# Most context tokens sent to Gemini; only the best sentences of the retrieved chunks are kept (0 = send whole chunks)
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+context_packer = ContextPacker(token_budget=context_token_budget)
+
+# Retrieved context is reused for repeat questions and reruns until it expires
+retrieval_cache_ttl = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+retrieval_cache_size = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+
 # Store pdf_path in session state
 if "pdf_path" not in st.session_state:
     st.session_state["pdf_path"] = pdf_path
@@ -50,6 +82,23 @@ def extract_text_from_pdf_app(file_path):
     doc.close()
     return text
 
+def chunk_id(text):
+    # The same chunk text always gets the same id, so restarts find the vectors already stored
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def sync_collection(collection, nodes):
+    """
+    Diff the PDF's chunks against the Chroma collection.
+    Deletes vectors of chunks that are no longer in the PDF (including
+    duplicates left by older runs) and returns the nodes that still need embedding.
+    """
+    stored_ids = set(collection.get(include=[])["ids"])
+    current_ids = {node.id_ for node in nodes}
+    stale_ids = list(stored_ids - current_ids)
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    return [node for node in nodes if node.id_ not in stored_ids]
+
 @st.cache_resource
 def setup_rag_components():
     st.write("Initializing RAG components...")
@@ -64,42 +113,86 @@ def setup_rag_components():
     splitter = SentenceSplitter(chunk_size=512, chunk_overlap=50)
     nodes = splitter.get_nodes_from_documents([doc])
 
+    # Content-hash ids make ingestion idempotent; repeated chunks are kept once
+    unique_nodes = {}
+    for node in nodes:
+        node.id_ = chunk_id(node.get_content())
+        unique_nodes.setdefault(node.id_, node)
+    nodes = list(unique_nodes.values())
+
     # --- BM25 Retriever (keep existing) ---
-    bm25_retriever = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=5)
+    # Queried from several fusion workers and the expander at once; each thread gets its own stemmer
+    bm25_retriever = ThreadSafeBM25Retriever.from_defaults(nodes=nodes, similarity_top_k=5)
 
     # --- Vector Retriever Setup (NEW) ---
-    embed_model = GoogleGenAIEmbedding(
-        model_name="models/embedding-001",
-        api_key=os.getenv("GEMINI_API_KEY")
+    # Cached on disk, so restarting the app does not re-embed unchanged chunks
+    embed_model = CachedEmbedding.wrap(
+        GoogleGenAIEmbedding(
+            model_name="models/embedding-001",
+            api_key=os.getenv("GEMINI_API_KEY")
+        ),
+        cache_dir="./embedding_cache"
     )
 
-    db = chromadb.PersistentClient(path="./chroma_db")
-    collection = db.get_or_create_collection("ncert_physics_rag")
-    vector_store = ChromaVectorStore(collection)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    if dense_backend == "numpy":
+        # Brute-force search over a memory-mapped float16 matrix; no vector database
+        vector_retriever = NumpyDenseRetriever.from_nodes(
+            nodes,
+            embed_model,
+            persist_dir="./dense_index",
+            similarity_top_k=5
+        )
+        st.write(f"Dense index: {len(vector_retriever)} chunks.")
+    else:
+        db = chromadb.PersistentClient(path="./chroma_db")
+        collection = db.get_or_create_collection("ncert_physics_rag")
+        vector_store = ChromaVectorStore(collection)
 
-    vector_index = VectorStoreIndex(
-        nodes,
-        storage_context=storage_context,
-        embed_model=embed_model,
-        show_progress=False
-    )
-    vector_retriever = vector_index.as_retriever(similarity_top_k=5)
+        # Attach to the vectors already in the collection and embed only new chunks
+        vector_index = VectorStoreIndex.from_vector_store(
+            vector_store,
+            embed_model=embed_model
+        )
+        new_nodes = sync_collection(collection, nodes)
+        if new_nodes:
+            vector_index.insert_nodes(new_nodes)
+        st.write(f"Vector store: {len(new_nodes)} new chunks embedded, {len(nodes) - len(new_nodes)} already stored.")
+        vector_retriever = vector_index.as_retriever(similarity_top_k=5)
 
     # --- Hybrid Retriever (NEW) ---
-    fusion_retriever = QueryFusionRetriever(
+    # Query variants come from a local or cached expander, not a Gemini call per question
+    expander = make_query_expander(
+        query_expansion,
+        bm25_retriever,
+        nodes,
+        llm=Settings.llm,
+        cache_path="./query_expansion_cache.db"
+    )
+    # Every (query variant, retriever) pair runs concurrently under its retriever's deadline
+    fusion_retriever = ExpandingFusionRetriever(
         [bm25_retriever, vector_retriever],
+        expander,
+        deadlines=[bm25_deadline, vector_deadline],
+        names=["bm25", "vector"],
         llm=Settings.llm,
         mode="reciprocal_rerank",
         num_queries=4,
         verbose=True
     )
 
+    # Shared by the answer path and the context viewer; keys include the index version
+    retrieval_cache = RetrievalCache(max_entries=retrieval_cache_size, ttl=retrieval_cache_ttl)
+    cached_retriever = CachedRetriever(
+        fusion_retriever,
+        retrieval_cache,
+        index_version(node.id_ for node in nodes)
+    )
+
     st.success("Hybrid (BM25 + Vector) Retriever ready.")
-    return fusion_retriever
+    return cached_retriever
 
 @st.cache_resource
-def get_gemini_model():
+def get_model_resolver():
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         st.error("Gemini API Key not found. Please set GEMINI_API_KEY in Colab Secrets or as an environment variable.")
@@ -107,86 +200,116 @@ def get_gemini_model():
 
     genai.configure(api_key=api_key)
 
-    model_to_use = None
+    # The choice is cached on disk; discovery only runs in the background when it is missing or old
+    resolver = GeminiModelResolver(
+        api_key,
+        cache_path="./gemini_model_cache.json",
+        ttl=gemini_model_cache_ttl
+    )
+    resolver.start()
+    return resolver
+
+def get_gemini_model(model_resolver):
+    return genai.GenerativeModel(model_resolver.model_name())
+
+async def stream_gemini(gemini_model, prompt):
+    """
+    Yield the answer text as Gemini generates it.
+    Uses the async client, so the event loop stays free for the other panels
+    while chunks arrive, without a worker thread per chunk.
+    """
+    response = await gemini_model.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        # A chunk without parts (e.g. the final one of a blocked answer) has no text
+        if chunk.parts:
+            yield chunk.text
+
+async def render_answer(area, model_resolver, user_question, retrieval):
+    status = area.empty()
+    status.info('Searching and generating response...')
+    try:
+        retrieved_nodes = await retrieval
+        if not retrieved_nodes:
+            status.warning("I don't have information on that topic. Please ask about the NCERT textbook.")
+            return
+        # Only the sentences that best match the question, within the token budget
+        packed = context_packer.pack(user_question, retrieved_nodes)
+        prompt = f'Context:\n{packed.text}\n\nQuestion: {user_question}\nAnswer:'
+        # Waits only if this is the first start and model discovery hasn't finished yet
+        gemini_model = await asyncio.to_thread(get_gemini_model, model_resolver)
+        status.subheader('Answer:')
+        answer = area.empty()
+        text = ''
+        async for part in stream_gemini(gemini_model, prompt):
+            text += part
+            answer.write(text + '▌')
+        answer.write(text)
+        area.caption(f'{gemini_model.model_name} · Context: {packed.tokens_out} tokens sent, {packed.tokens_saved} saved '
+                     f'({packed.sentences_kept} of {packed.sentences_total} sentences kept)')
+    except Exception as e:
+        status.error(f'An error occurred during response generation: {e}')
+
+async def render_context(area, retrieval):
+    status = area.empty()
+    status.info('Retrieving context...')
     try:
-        available_gemini_models = []
-        for m in genai.list_models():
-            if "generateContent" in m.supported_generation_methods:
-                if "gemini" in m.name.lower() and "vision" not in m.name.lower():
-                    available_gemini_models.append(m.name)
-
-        priority_models = [
-            "models/gemini-1.5-flash-latest",
-            "models/gemini-1.5-flash",
-            "models/gemini-1.5-pro-latest",
-            "models/gemini-1.5-pro",
-            "models/gemini-pro"
-        ]
-
-        for p_model in priority_models:
-            if p_model in available_gemini_models:
-                model_to_use = p_model
-                break
-
-        if model_to_use:
-            st.success(f"Using Gemini model: {model_to_use}")
-            return genai.GenerativeModel(model_to_use)
+        retrieved_nodes = await retrieval
+        if retrieved_nodes:
+            status.subheader('Retrieved Context:')
+            for i, node in enumerate(retrieved_nodes):
+                area.text_area(f'Context Chunk {i+1}', node.get_content(), height=150)
         else:
-            st.error("No suitable text-only Gemini model found. Please check your API key and model access.")
-            st.stop()
+            status.info('No relevant context found.')
     except Exception as e:
-        st.error(f"Error verifying Gemini model: {e}. Please check your API key.")
-        st.stop()
+        status.error(f'Context retrieval error: {e}')
 
 async def main():
     st.title("📚 NCERT RAG Chatbot")
     st.write("Ask questions about the NCERT textbook.")
 
+    # Start model discovery first so it runs while the RAG components load
+    model_resolver = get_model_resolver()
+
     if "hybrid_retriever" not in st.session_state:
         with st.spinner("Initializing RAG components..."):
             st.session_state.hybrid_retriever = setup_rag_components()
 
     hybrid_retriever = st.session_state.hybrid_retriever
-
-    gemini_model = get_gemini_model()
-    if gemini_model is None:
+    if hybrid_retriever is None:
         st.stop()
 
     user_question = st.text_input('Your Question:', 'What was the Soviet System?')
 
-    if st.button('Get Answer'):
+    ask = st.button('Get Answer')
+    answer_area = st.container()
+    show_context = st.checkbox('Show Retrieved Context')
+    context_area = st.container()
+
+    retrieval = None
+    if user_question and (ask or show_context):
+        # One retrieval feeds both the answer and the context panel
+        retrieval = asyncio.ensure_future(hybrid_retriever.aretrieve(user_question))
+
+    tasks = []
+    if ask:
         if user_question:
-            with st.spinner('Searching and generating response...'):
-                try:
-                    retrieved_nodes = await hybrid_retriever.aretrieve(user_question)
-                    if not retrieved_nodes:
-                        st.warning("I don't have information on that topic. Please ask about the NCERT textbook.")
-                    else:
-                        context = '\n\n'.join([n.get_content() for n in retrieved_nodes])
-                        prompt = f'Context:\n{context}\n\nQuestion: {user_question}\nAnswer:'
-                        response = gemini_model.generate_content(prompt)
-                        st.subheader('Answer:')
-                        st.write(response.text)
-                except Exception as e:
-                    st.error(f'An error occurred during response generation: {e}')
+            tasks.append(render_answer(answer_area, model_resolver, user_question, retrieval))
         else:
-            st.warning('Please enter a question.')
-
-    if st.checkbox('Show Retrieved Context'):
+            answer_area.warning('Please enter a question.')
+    if show_context:
         if user_question:
-            with st.spinner('Retrieving context...'):
-                try:
-                    retrieved_nodes = await hybrid_retriever.aretrieve(user_question)
-                    if retrieved_nodes:
-                        st.subheader('Retrieved Context:')
-                        for i, node in enumerate(retrieved_nodes):
-                            st.text_area(f'Context Chunk {i+1}', node.get_content(), height=150)
-                    else:
-                        st.info('No relevant context found.')
-                except Exception as e:
-                    st.error(f'Context retrieval error: {e}')
+            tasks.append(render_context(context_area, retrieval))
         else:
-            st.info('Enter a question first.')
+            context_area.info('Enter a question first.')
+    # The context panel fills in as soon as retrieval is done, while the answer is still streaming
+    await asyncio.gather(*tasks)
+
+    with st.sidebar.expander('Retriever latency'):
+        # Timeouts are queries whose results missed the deadline and were left out of the fusion;
+        # skipped ones were not run because every worker was still stuck on a late call
+        st.json(hybrid_retriever.latency_stats())
+        st.caption('Retrieval cache')
+        st.json(hybrid_retriever.cache.stats())
 
 if __name__ == '__main__':
     asyncio.run(main())
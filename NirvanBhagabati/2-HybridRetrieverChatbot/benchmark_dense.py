@@ -0,0 +1,173 @@
+"""
+Benchmark the dense retrieval backends of the hybrid chatbot: Chroma vs NumPy.
+
+Both retrievers are driven exactly as the fusion retriever drives them
+(retrieve() with a question whose embedding is already known), over the same
+unit vectors. The vectors are random: search cost does not depend on what
+they mean, and no embedding API is needed. For each backend the report records:
+
+    build            time to store the vectors (Chroma add / .npy write)
+    open             time to reopen the persisted index and answer one query
+    query            single-question latency p50 / p95 / p99
+    batch            per-question time when all questions go in one call (NumPy only)
+    recall@k         overlap with the exact top k
+
+    python benchmark_dense.py
+    python benchmark_dense.py --chunks 20000 --dim 768 --queries 500
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, List
+
+import chromadb
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from pydantic import PrivateAttr
+
+from dense_retriever import NumpyDenseRetriever, normalize_rows
+
+CHROMA_BATCH = 1000
+
+
+class TableEmbedding(BaseEmbedding):
+    """
+    Looks up precomputed vectors by text, so building an index embeds nothing.
+    """
+
+    _table: dict = PrivateAttr()
+
+    def __init__(self, table, **kwargs: Any) -> None:
+        super().__init__(model_name="benchmark-table", **kwargs)
+        self._table = table
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._table[text]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._table[query]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._table[query]
+
+
+def percentiles_ms(values):
+    return {f"p{q}_ms": float(np.percentile(values, q)) * 1000 for q in (50, 95, 99)}
+
+
+def time_queries(retriever, queries):
+    latencies, results = [], []
+    for i, query in enumerate(queries):
+        bundle = QueryBundle(f"question {i}", embedding=query.tolist())
+        start = time.perf_counter()
+        nodes = retriever.retrieve(bundle)
+        latencies.append(time.perf_counter() - start)
+        results.append([node.node.id_ for node in nodes])
+    return latencies, results
+
+
+def recall(results, exact):
+    return float(np.mean([len(set(got) & set(want)) / len(want) for got, want in zip(results, exact)]))
+
+
+def bench_chroma(nodes, vectors, embed_model, queries, top_k, path):
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection("benchmark")
+    for i in range(0, len(nodes), CHROMA_BATCH):
+        batch = nodes[i:i + CHROMA_BATCH]
+        collection.add(
+            ids=[node.id_ for node in batch],
+            embeddings=vectors[i:i + CHROMA_BATCH].tolist(),
+            documents=[node.get_content() for node in batch],
+        )
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection("benchmark")
+    index = VectorStoreIndex.from_vector_store(ChromaVectorStore(chroma_collection=collection), embed_model=embed_model)
+    retriever = index.as_retriever(similarity_top_k=top_k)
+    time_queries(retriever, queries[:1])
+    open_s = time.perf_counter() - start
+
+    latencies, results = time_queries(retriever, queries)
+    return {"build_s": build_s, "open_s": open_s, **percentiles_ms(latencies)}, results
+
+
+def bench_numpy(nodes, embed_model, queries, top_k, path, max_resident_mb):
+    start = time.perf_counter()
+    NumpyDenseRetriever.from_nodes(nodes, embed_model, persist_dir=path)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    retriever = NumpyDenseRetriever.from_nodes(
+        nodes, embed_model, persist_dir=path, similarity_top_k=top_k, max_resident_mb=max_resident_mb
+    )
+    time_queries(retriever, queries[:1])
+    open_s = time.perf_counter() - start
+
+    latencies, results = time_queries(retriever, queries)
+
+    start = time.perf_counter()
+    retriever.search(queries)
+    batch_ms = (time.perf_counter() - start) / len(queries) * 1000
+    return {"build_s": build_s, "open_s": open_s, **percentiles_ms(latencies), "batch_ms_per_query": batch_ms}, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs NumPy dense retrieval.")
+    parser.add_argument("--chunks", type=int, default=5000, help="Indexed chunks")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (embedding-001: 768)")
+    parser.add_argument("--queries", type=int, default=200, help="Timed questions")
+    parser.add_argument("--top-k", type=int, default=5, help="Chunks retrieved per question")
+    parser.add_argument("--max-resident-mb", type=float, default=256,
+                        help="NumPy: largest matrix kept in RAM as float32 (0 streams from the memory map)")
+    parser.add_argument("--out", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = normalize_rows(rng.standard_normal((args.chunks, args.dim), dtype=np.float32))
+    queries = normalize_rows(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+    nodes = [TextNode(id_=f"chunk-{i}", text=f"chunk {i}") for i in range(args.chunks)]
+    embed_model = TableEmbedding({node.get_content(): vector.tolist() for node, vector in zip(nodes, vectors)})
+
+    # Exact answers at full precision, to measure what HNSW and float16 give up
+    scores = vectors @ queries.T
+    exact = [[nodes[row].id_ for row in np.argsort(-scores[:, q])[:args.top_k]] for q in range(args.queries)]
+
+    workdir = tempfile.mkdtemp(prefix="benchmark_dense-")
+    try:
+        chroma, chroma_results = bench_chroma(
+            nodes, vectors, embed_model, queries, args.top_k, os.path.join(workdir, "chroma")
+        )
+        dense, dense_results = bench_numpy(
+            nodes, embed_model, queries, args.top_k, os.path.join(workdir, "numpy"), args.max_resident_mb
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    chroma["recall_at_k"] = recall(chroma_results, exact)
+    dense["recall_at_k"] = recall(dense_results, exact)
+
+    report = {"chunks": args.chunks, "dim": args.dim, "queries": args.queries, "top_k": args.top_k,
+              "chroma": chroma, "numpy": dense}
+    columns = ["build_s", "open_s", "p50_ms", "p95_ms", "p99_ms", "batch_ms_per_query", "recall_at_k"]
+    print(f"{args.chunks} chunks x {args.dim} dims, {args.queries} questions, top {args.top_k}")
+    print("backend\t" + "\t".join(columns))
+    for backend in ("chroma", "numpy"):
+        row = report[backend]
+        print(backend + "\t" + "\t".join(f"{row[c]:.3f}" if c in row else "-" for c in columns))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
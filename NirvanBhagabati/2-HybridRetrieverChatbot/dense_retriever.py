@@ -0,0 +1,152 @@
+"""
+In-process dense retriever: brute-force cosine search with NumPy.
+
+One NCERT textbook is a few thousand chunks at most, and at that size a
+single matrix product over every chunk is cheaper than going through
+Chroma's persistent client (SQLite plus HNSW files) and exact rather than
+approximate. NumpyDenseRetriever is a drop-in for the Chroma vector
+retriever in the fusion retriever.
+
+The L2-normalized chunk embeddings are stored as a float16 .npy file and
+opened memory-mapped, next to a meta.json with the chunk ids and the
+embedding model. They are rebuilt only when the chunks or the model change,
+and the vectors come through CachedEmbedding, so a rebuild makes no
+embedding calls either. NumPy has no float16 matmul kernel: matrices up to
+`max_resident_mb` are upcast to float32 once at load; larger ones are
+scored block by block straight from the memory map.
+
+Layout of a persist directory:
+    <persist_dir>/meta.json     model name, index version and chunk ids in row order
+    <persist_dir>/vectors.npy   float16 unit vectors, one row per chunk
+"""
+
+import json
+import os
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from retrieval_cache import index_version
+
+BLOCK_ROWS = 8192
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Leave all-zero rows at zero instead of dividing by zero
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyDenseRetriever(BaseRetriever):
+    """
+    Exact top-k cosine retriever over a float16 embedding matrix.
+
+    Args:
+        nodes (list): Chunks, in the row order of `vectors`
+        vectors (np.ndarray): (len(nodes), dim) unit vectors, typically a float16 memmap
+        embed_model: Model used to embed questions
+        similarity_top_k (int): Chunks returned per question
+        max_resident_mb (float): Largest matrix kept in RAM as float32; bigger
+            matrices are scored block by block from `vectors`
+    """
+
+    def __init__(self, nodes, vectors, embed_model, similarity_top_k=5, max_resident_mb=256, callback_manager=None):
+        self._nodes = list(nodes)
+        self._embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+        self._vectors = vectors
+        if vectors.shape[0] * vectors.shape[1] * 4 <= max_resident_mb * 1024 * 1024:
+            self._vectors = np.asarray(vectors, dtype=np.float32)
+        super().__init__(callback_manager=callback_manager)
+
+    @classmethod
+    def from_nodes(cls, nodes, embed_model, persist_dir="./dense_index", **kwargs):
+        """
+        Open the matrix persisted for `nodes`, embedding and saving it first if
+        the chunks or the embedding model changed since it was written.
+        """
+        version = index_version(node.id_ for node in nodes)
+        meta_path = os.path.join(persist_dir, "meta.json")
+        vectors_path = os.path.join(persist_dir, "vectors.npy")
+        meta = None
+        if os.path.exists(meta_path) and os.path.exists(vectors_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta is None or meta["version"] != version or meta["model_name"] != embed_model.model_name:
+            meta = cls._build(nodes, embed_model, persist_dir, version)
+        by_id = {node.id_: node for node in nodes}
+        ordered = [by_id[node_id] for node_id in meta["ids"]]
+        vectors = np.load(vectors_path, mmap_mode="r")
+        return cls(ordered, vectors, embed_model, **kwargs)
+
+    @staticmethod
+    def _build(nodes, embed_model, persist_dir, version):
+        os.makedirs(persist_dir, exist_ok=True)
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        embeddings = embed_model.get_text_embedding_batch(texts, show_progress=True)
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32)).astype(np.float16)
+        meta = {
+            "model_name": embed_model.model_name,
+            "version": version,
+            "ids": [node.id_ for node in nodes],
+        }
+        # Write to temporary names and swap in, vectors before meta, so readers never see a half-written index
+        vectors_tmp = os.path.join(persist_dir, "vectors.tmp.npy")
+        meta_tmp = os.path.join(persist_dir, "meta.tmp.json")
+        np.save(vectors_tmp, vectors)
+        with open(meta_tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(vectors_tmp, os.path.join(persist_dir, "vectors.npy"))
+        os.replace(meta_tmp, os.path.join(persist_dir, "meta.json"))
+        return meta
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _scores(self, queries):
+        # (chunks, queries) cosine similarities
+        if self._vectors.dtype == np.float32:
+            return self._vectors @ queries.T
+        scores = np.empty((len(self._vectors), len(queries)), dtype=np.float32)
+        for start in range(0, len(self._vectors), BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ queries.T
+        return scores
+
+    def search(self, query_embeddings, top_k=None):
+        """
+        Score a batch of query embeddings against every chunk at once.
+
+        Returns one list of (row, score) pairs per query, best first.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        top_k = min(top_k or self.similarity_top_k, len(self._nodes))
+        if top_k == 0:
+            return [[] for _ in queries]
+        scores = self._scores(queries)
+        # argpartition finds the top k of every column without sorting all of it
+        top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+        results = []
+        for column in range(len(queries)):
+            rows = top[:, column]
+            order = np.argsort(-scores[rows, column])
+            results.append([(int(rows[i]), float(scores[rows[i], column])) for i in order])
+        return results
+
+    def _to_nodes(self, hits):
+        return [NodeWithScore(node=self._nodes[row], score=score) for row, score in hits]
+
+    def _retrieve(self, query_bundle):
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        return self._to_nodes(self.search(embedding)[0])
+
+    def retrieve_batch(self, questions):
+        """
+        Retrieve for several questions with one matrix product.
+        """
+        embeddings = [self._embed_model.get_query_embedding(question) for question in questions]
+        return [self._to_nodes(hits) for hits in self.search(embeddings)]
@@ -0,0 +1,300 @@
+"""
+Concurrent fusion retrieval with per-retriever deadlines.
+
+QueryFusionRetriever sends every query variant to every retriever, but its
+async path only overlaps retrievers with real async support: BM25 and the
+Chroma query run on the event loop, one after another, and a slow embedding
+call holds up the whole answer. DeadlineFusionRetriever instead runs each
+(query variant x retriever) pair on a worker thread and gives every retriever
+its own deadline. Results that miss the deadline (or fail) are dropped and
+fusion works with whatever arrived, so the slowest retriever no longer sets
+the floor for every answer. Per-retriever latency counters show how often
+each one is late; see latency_stats().
+
+A deadline starts when the call starts running on a worker, not when it is
+queued, so waiting for a free thread is never mistaken for a slow retriever
+(the wait for a thread is bounded by one deadline of its own). A call that
+misses its deadline cannot be interrupted and keeps its worker until it
+returns; while every worker of a retriever is held by such abandoned calls,
+new queries skip that retriever instead of queueing behind them.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+import Stemmer
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.retrievers.bm25 import BM25Retriever
+
+logger = logging.getLogger(__name__)
+
+# Set by every fused retrieval: False when a late or failed pair was left out of the fusion
+retrieval_complete = contextvars.ContextVar("retrieval_complete", default=True)
+
+
+class RetrieverLatency:
+    """
+    Latency counters for one retriever.
+
+    Args:
+        name (str): Label shown in latency_stats()
+        window (int): Recent latencies kept for the percentiles
+    """
+
+    def __init__(self, name, window=500):
+        self.name = name
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.skipped = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        # Late results are recorded too: they show how far off the deadline is
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            calls, timeouts, errors, skipped = self.calls, self.timeouts, self.errors, self.skipped
+        stats = {"calls": calls, "timeouts": timeouts, "errors": errors, "skipped": skipped}
+        if latencies:
+            stats["p50_ms"] = float(np.percentile(latencies, 50)) * 1000
+            stats["p95_ms"] = float(np.percentile(latencies, 95)) * 1000
+            stats["max_ms"] = max(latencies) * 1000
+        return stats
+
+
+class ThreadSafeBM25Retriever(BM25Retriever):
+    """
+    BM25Retriever that gives every thread its own PyStemmer stemmer.
+
+    The fusion workers and the query expander query the same retriever from
+    several threads, but BM25Retriever stems every query with a single Stemmer
+    object, which is not thread-safe. The index itself is only read, so a
+    per-thread stemmer is all that is needed for concurrent retrieve() calls.
+    """
+
+    @property
+    def stemmer(self):
+        local = self.__dict__.setdefault("_stemmers", threading.local())
+        stemmer = getattr(local, "stemmer", None)
+        if stemmer is None:
+            stemmer = local.stemmer = Stemmer.Stemmer("english")
+        return stemmer
+
+    @stemmer.setter
+    def stemmer(self, value):
+        # The stemmer handed to __init__ only serves the thread that built the retriever
+        self.__dict__.setdefault("_stemmers", threading.local()).stemmer = value
+
+
+class RetrieverSaturated(Exception):
+    """
+    Every worker of a retriever is still held by calls that missed their deadline.
+    """
+
+
+class _PendingCall:
+    """
+    One submitted (query, retriever) pair: when it was queued and started, and
+    whether the caller has given up on it.
+    """
+
+    def __init__(self, on_start=None):
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.started = threading.Event()
+        self.on_start = on_start
+        self.finished = False
+        self.abandoned = False
+
+
+class DeadlineFusionRetriever(QueryFusionRetriever):
+    """
+    QueryFusionRetriever that runs every (query, retriever) pair concurrently,
+    each bounded by its retriever's deadline.
+
+    Args:
+        retrievers (list): Retrievers to fuse; each must be safe to query from
+            several threads at once (use ThreadSafeBM25Retriever for BM25)
+        deadlines (list): Seconds each retriever gets per query, counted from
+            when the call starts running; None means no deadline
+        names (list): Labels for latency_stats(); defaults to the class names
+        max_workers (int): Threads per retriever; each retriever has its own
+            pool, so one that keeps missing its deadline can't starve the others
+    """
+
+    def __init__(self, retrievers, deadlines=None, names=None, max_workers=4, **kwargs):
+        super().__init__(retrievers, **kwargs)
+        self._deadlines = list(deadlines) if deadlines is not None else [None] * len(retrievers)
+        names = names or [type(retriever).__name__ for retriever in retrievers]
+        self._latency = [RetrieverLatency(name) for name in names]
+        self._max_workers = max_workers
+        self._executors = [
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"fusion-{latency.name}")
+            for latency in self._latency
+        ]
+        # Abandoned calls still running, per retriever; each one holds a worker
+        self._abandoned = [0] * len(retrievers)
+        self._calls_lock = threading.Lock()
+
+    def latency_stats(self):
+        """
+        Return the latency counters of every retriever, keyed by name.
+        """
+        with self._calls_lock:
+            abandoned = list(self._abandoned)
+        stats = {}
+        for latency, stuck in zip(self._latency, abandoned):
+            stats[latency.name] = latency.snapshot()
+            stats[latency.name]["stuck_workers"] = stuck
+        return stats
+
+    def _run_one(self, i, query, call):
+        with self._calls_lock:
+            if call.abandoned:
+                # The caller stopped waiting while this was still queued
+                return None
+            call.started_at = time.perf_counter()
+        call.started.set()
+        try:
+            if call.on_start is not None:
+                call.on_start()
+            nodes = self._retrievers[i].retrieve(query)
+        finally:
+            latency = time.perf_counter() - call.started_at
+            with self._calls_lock:
+                call.finished = True
+                if call.abandoned:
+                    self._abandoned[i] -= 1
+        self._latency[i].record(latency)
+        return nodes
+
+    def _submit(self, i, query, on_start=None):
+        # Returns the pair's call and future, or (None, None) when its retriever has no usable worker
+        with self._calls_lock:
+            if self._abandoned[i] >= self._max_workers:
+                return None, None
+        call = _PendingCall(on_start)
+        return call, self._executors[i].submit(self._run_one, i, query, call)
+
+    def _abandon(self, i, call, future):
+        # Called when the caller stops waiting; a call that is running keeps its worker until it returns
+        with self._calls_lock:
+            if not call.finished:
+                call.abandoned = True
+                if call.started_at is not None:
+                    self._abandoned[i] += 1
+        future.cancel()
+
+    def _remaining(self, since, deadline):
+        return max(0.0, since + deadline - time.perf_counter())
+
+    def _collect(self, key, i, outcome):
+        # Turn one pair's outcome into its result, or None when it has to be dropped
+        if isinstance(outcome, RetrieverSaturated):
+            self._latency[i].record_skipped()
+            if self._verbose:
+                logger.warning("%s skipped for %r: every worker is stuck on a late call", self._latency[i].name, key[0])
+            return None
+        if isinstance(outcome, (asyncio.TimeoutError, FutureTimeoutError)):
+            self._latency[i].record_timeout()
+            if self._verbose:
+                logger.warning("%s missed its %ss deadline for %r", self._latency[i].name, self._deadlines[i], key[0])
+            return None
+        if isinstance(outcome, BaseException):
+            self._latency[i].record_error()
+            logger.warning("%s failed for %r", self._latency[i].name, key[0], exc_info=outcome)
+            return None
+        return outcome
+
+    def _pairs(self, queries):
+        return [(query, i) for query in queries for i in range(len(self._retrievers))]
+
+    def _wait(self, i, call, future):
+        # Blocking wait for one pair: up to a deadline for a worker, then a deadline from the start of the call
+        deadline = self._deadlines[i]
+        if future is None:
+            raise RetrieverSaturated()
+        if deadline is None:
+            return future.result()
+        try:
+            if not call.started.wait(timeout=self._remaining(call.submitted_at, deadline)):
+                raise FutureTimeoutError()
+            return future.result(timeout=self._remaining(call.started_at, deadline))
+        except FutureTimeoutError:
+            self._abandon(i, call, future)
+            raise
+
+    async def _wait_async(self, i, call, future, started):
+        # Event-loop counterpart of _wait; `started` is set by the worker through the loop
+        deadline = self._deadlines[i]
+        if future is None:
+            raise RetrieverSaturated()
+        result = asyncio.wrap_future(future)
+        if deadline is None:
+            return await result
+        try:
+            await asyncio.wait_for(started.wait(), timeout=self._remaining(call.submitted_at, deadline))
+            return await asyncio.wait_for(result, timeout=self._remaining(call.started_at, deadline))
+        except asyncio.TimeoutError:
+            self._abandon(i, call, future)
+            raise
+
+    def _run_nested_async_queries(self, queries):
+        # Sync entry point (retrieve()): no event loop needed, wait on the futures directly
+        pairs = self._pairs(queries)
+        submitted = [self._submit(i, query) for query, i in pairs]
+        results = {}
+        for (query, i), (call, future) in zip(pairs, submitted):
+            try:
+                outcome = self._wait(i, call, future)
+            except Exception as e:
+                outcome = e
+            key = (query.query_str, i)
+            nodes = self._collect(key, i, outcome)
+            if nodes is not None:
+                results[key] = nodes
+        retrieval_complete.set(len(results) == len(pairs))
+        return results
+
+    async def _run_async_queries(self, queries):
+        loop = asyncio.get_running_loop()
+        pairs = self._pairs(queries)
+        tasks = []
+        for query, i in pairs:
+            started = asyncio.Event()
+            call, future = self._submit(i, query, on_start=lambda started=started: loop.call_soon_threadsafe(started.set))
+            tasks.append(self._wait_async(i, call, future, started))
+        # A late, skipped or failed pair is dropped; it never fails the whole retrieval
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        results = {}
+        for (query, i), outcome in zip(pairs, outcomes):
+            key = (query.query_str, i)
+            nodes = self._collect(key, i, outcome)
+            if nodes is not None:
+                results[key] = nodes
+        retrieval_complete.set(len(results) == len(pairs))
+        return results
@@ -0,0 +1,253 @@
+"""
+Query expansion for the hybrid retriever's fusion layer.
+
+QueryFusionRetriever normally asks the LLM for extra query variants on every
+question, a blocking round trip before any retrieval starts. Here the
+variants come from a pluggable QueryExpander instead:
+
+- PRFExpander: pseudo-relevance feedback over the corpus vocabulary. The
+  question is run through BM25 and the terms with the most feedback weight
+  in the best chunks (RM3: frequent in the high-scoring chunks, shared by at
+  least two of them, rare in the corpus) are added to it. Local, a few ms.
+  On a small corpus such as a single chapter the feedback is thin and the
+  added terms are often noise, so it is opt-in rather than the default.
+- CachedLLMExpander: the usual LLM-generated variants, memoized in a SQLite
+  file keyed by the normalized question, so repeat questions never wait on
+  the LLM. With a fallback expander, even first-time questions don't wait:
+  the fallback answers immediately and the LLM variants are generated in
+  the background for next time.
+- NoExpansion: the original question only.
+"""
+
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from bm25s.stopwords import STOPWORDS_EN_PLUS
+from llama_index.core.retrievers.fusion_retriever import QUERY_GEN_PROMPT
+from llama_index.core.schema import QueryBundle
+
+from fusion_deadlines import DeadlineFusionRetriever
+
+logger = logging.getLogger(__name__)
+
+# NLTK's English list (bundled with bm25s) plus the filler words it leaves out,
+# which otherwise come out on top as expansion terms
+STOPWORDS = frozenset(STOPWORDS_EN_PLUS) | {
+    "also", "although", "among", "another", "around", "away", "back", "came", "come", "could", "done",
+    "due", "either", "else", "even", "ever", "every", "felt", "first", "five", "four", "get", "give",
+    "given", "got", "however", "like", "made", "make", "many", "may", "might", "much", "must", "never",
+    "one", "often", "per", "put", "rather", "said", "say", "says", "second", "see", "seen", "shall",
+    "since", "still", "take", "taken", "third", "three", "thus", "together", "toward", "towards", "two",
+    "upon", "use", "used", "way", "well", "whether", "within", "without", "would", "yet",
+}
+
+WORD = re.compile(r"[a-z]{3,}")
+
+
+def normalize_question(question):
+    # Case, punctuation and spacing don't change what a question asks
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+def content_terms(text):
+    return [w for w in WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+class QueryExpander:
+    """
+    Interface: turns a question into up to `num_variants` extra search queries.
+    """
+
+    def expand(self, question, num_variants):
+        raise NotImplementedError
+
+
+class NoExpansion(QueryExpander):
+    def expand(self, question, num_variants):
+        return []
+
+
+class PRFExpander(QueryExpander):
+    """
+    Pseudo-relevance feedback expander built from the corpus vocabulary (RM3-style).
+
+    Args:
+        bm25_retriever: Retriever used for the feedback search
+        nodes: The corpus chunks, used for document frequencies
+        feedback_docs (int): Top chunks treated as relevant
+        terms_per_variant (int): Expansion terms added to the question per variant
+        min_feedback_docs (int): Feedback chunks a term must occur in; a term
+            from a single chunk describes that passage, not the topic
+        min_doc_freq (int): Chunks a term must occur in to be added; rarer
+            terms are mostly typos, names from one passage and PDF extraction noise
+        min_idf (float): Terms below this IDF occur in too much of the corpus
+            to narrow a search
+    """
+
+    def __init__(self, bm25_retriever, nodes, feedback_docs=3, terms_per_variant=2, min_feedback_docs=2,
+                 min_doc_freq=2, min_idf=1.5):
+        self.bm25_retriever = bm25_retriever
+        self.feedback_docs = feedback_docs
+        self.terms_per_variant = terms_per_variant
+        self.min_feedback_docs = min_feedback_docs
+        self.min_doc_freq = min_doc_freq
+        self.min_idf = min_idf
+        self.num_docs = len(nodes)
+        self.doc_freq = Counter()
+        for node in nodes:
+            self.doc_freq.update(set(content_terms(node.get_content())))
+
+    def expand(self, question, num_variants):
+        if num_variants <= 0:
+            return []
+        hits = self.bm25_retriever.retrieve(question)
+        hits = [hit for hit in hits[:self.feedback_docs] if (hit.score or 0.0) > 0]
+        total_score = sum(hit.score for hit in hits)
+        # RM3 feedback weight: a term's share of each chunk, weighted by that chunk's share of the retrieval score
+        weight = Counter()
+        feedback_freq = Counter()
+        for hit in hits:
+            terms = Counter(content_terms(hit.node.get_content()))
+            length = sum(terms.values())
+            if not length:
+                continue
+            for term, tf in terms.items():
+                weight[term] += (tf / length) * (hit.score / total_score)
+            feedback_freq.update(terms.keys())
+        question_terms = set(content_terms(question))
+        # Skip words sharing a 5-letter prefix with the question, a cheap stand-in for stemming
+        question_prefixes = {term[:5] for term in question_terms}
+        scored = []
+        for term, term_weight in weight.items():
+            if term in question_terms or term[:5] in question_prefixes:
+                continue
+            if feedback_freq[term] < self.min_feedback_docs:
+                continue
+            doc_freq = self.doc_freq.get(term, 0)
+            idf = math.log((self.num_docs + 1) / (doc_freq + 1))
+            if doc_freq < self.min_doc_freq or idf < self.min_idf:
+                continue
+            scored.append((term_weight, term))
+        scored.sort(reverse=True)
+        terms = [term for _, term in scored[:num_variants * self.terms_per_variant]]
+        variants = []
+        for i in range(0, len(terms), self.terms_per_variant):
+            variants.append(f"{question} {' '.join(terms[i:i + self.terms_per_variant])}")
+        return variants
+
+
+class CachedLLMExpander(QueryExpander):
+    """
+    LLM query generation (QueryFusionRetriever's prompt) memoized in a SQLite file.
+
+    Args:
+        llm: LLM used to generate variants
+        cache_path (str): SQLite file holding generated variants
+        fallback (QueryExpander): If given, answers cache misses immediately
+            while the LLM variants are generated in a background thread
+    """
+
+    def __init__(self, llm, cache_path="query_expansion_cache.db", fallback=None, prompt=QUERY_GEN_PROMPT):
+        self.llm = llm
+        self.cache_path = cache_path
+        self.fallback = fallback
+        self.prompt = prompt
+        self._local = threading.local()
+        self._pending = set()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_expansions ("
+                " key TEXT PRIMARY KEY,"
+                " queries TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.cache_path, timeout=10)
+        return conn
+
+    def _generate(self, question, num_variants):
+        response = self.llm.complete(self.prompt.format(num_queries=num_variants, query=question))
+        # Same parsing as QueryFusionRetriever: one query per line
+        queries = [q.strip() for q in response.text.strip("`").split("\n") if q.strip()]
+        return queries[:num_variants]
+
+    def _store(self, key, queries):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_expansions (key, queries, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(queries), time.time()),
+            )
+
+    def _generate_in_background(self, key, question, num_variants):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+
+        def run():
+            try:
+                self._store(key, self._generate(question, num_variants))
+            except Exception:
+                logger.exception("Query expansion failed for %r", question)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def expand(self, question, num_variants):
+        if num_variants <= 0:
+            return []
+        key = f"{num_variants}:{normalize_question(question)}"
+        row = self._connect().execute("SELECT queries FROM query_expansions WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        if self.fallback is not None:
+            self._generate_in_background(key, question, num_variants)
+            return self.fallback.expand(question, num_variants)
+        queries = self._generate(question, num_variants)
+        self._store(key, queries)
+        return queries
+
+
+class ExpandingFusionRetriever(DeadlineFusionRetriever):
+    """
+    Fusion retriever whose query variants come from a QueryExpander instead of an LLM call.
+    """
+
+    def __init__(self, retrievers, expander, **kwargs):
+        self._expander = expander
+        super().__init__(retrievers, **kwargs)
+
+    def _get_queries(self, original_query):
+        queries = self._expander.expand(original_query, self.num_queries - 1)
+        if self._verbose:
+            queries_str = "\n".join(queries)
+            print(f"Generated queries:\n{queries_str}")
+        return [QueryBundle(q) for q in queries[: self.num_queries - 1]]
+
+
+def make_query_expander(strategy, bm25_retriever, nodes, llm=None, cache_path="query_expansion_cache.db"):
+    """
+    Create the expander selected by configuration: "prf", "llm" or "none".
+    The "llm" strategy falls back to PRF while its cache warms up.
+    """
+    if strategy == "none":
+        return NoExpansion()
+    prf = PRFExpander(bm25_retriever, nodes)
+    if strategy == "prf":
+        return prf
+    if strategy == "llm":
+        return CachedLLMExpander(llm, cache_path=cache_path, fallback=prf)
+    raise ValueError(f"Unknown query expansion strategy: {strategy!r} (expected 'prf', 'llm' or 'none')")
@@ -0,0 +1,116 @@
+"""
+Per-question cache of hybrid retrieval results.
+
+Answering a question and then ticking "Show Retrieved Context" retrieved
+twice, and every Streamlit rerun retrieved again. CachedRetriever keeps the
+fused nodes keyed by (normalized question, index version), so all of those
+share one retrieval. Entries expire after a TTL and the least recently used
+are evicted beyond a size bound. The index version is derived from the chunk
+ids (content hashes), so a changed PDF gives new keys and stale results are
+never served. Degraded retrievals, where a retriever missed its deadline,
+are not cached: the next ask retries with every retriever.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from fusion_deadlines import retrieval_complete
+from query_expansion import normalize_question
+
+
+def index_version(chunk_ids):
+    """
+    Fingerprint of the indexed chunks; changes whenever the set of chunks does.
+    """
+    digest = hashlib.sha256()
+    for chunk_id in sorted(chunk_ids):
+        digest.update(chunk_id.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class RetrievalCache:
+    """
+    Thread-safe LRU cache with a time-to-live.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is evicted
+        ttl (float): Seconds an entry stays valid
+    """
+
+    def __init__(self, max_entries=256, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class CachedRetriever:
+    """
+    Wraps the hybrid retriever so repeated questions reuse the fused nodes.
+
+    Args:
+        retriever: The fusion retriever
+        cache (RetrievalCache): Shared result cache
+        version (str): index_version() of the chunks behind `retriever`
+    """
+
+    def __init__(self, retriever, cache, version):
+        self.retriever = retriever
+        self.cache = cache
+        self.version = version
+
+    def __getattr__(self, name):
+        # Everything else (latency_stats, ...) is the wrapped retriever's
+        return getattr(self.retriever, name)
+
+    def _key(self, question):
+        return (normalize_question(question), self.version)
+
+    async def aretrieve(self, question):
+        key = self._key(question)
+        nodes = self.cache.get(key)
+        if nodes is None:
+            retrieval_complete.set(True)
+            nodes = await self.retriever.aretrieve(question)
+            if retrieval_complete.get():
+                self.cache.put(key, nodes)
+        # Callers get their own list; the cached one stays as retrieved
+        return list(nodes)
+
+    def retrieve(self, question):
+        key = self._key(question)
+        nodes = self.cache.get(key)
+        if nodes is None:
+            retrieval_complete.set(True)
+            nodes = self.retriever.retrieve(question)
+            if retrieval_complete.get():
+                self.cache.put(key, nodes)
+        return list(nodes)
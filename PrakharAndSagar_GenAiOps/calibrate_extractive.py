@@ -0,0 +1,138 @@
+"""
+Calibrates the extractive fast path's thresholds on a PDF and sample questions.
+
+Each line of the questions file is a question, a `|`, and the terms a correct
+answer contains, separated by `;`:
+
+    When was the Berlin Wall built and when did it fall? | 1961; 1989
+
+The PDF is indexed with the app's own pipeline (build_pdf_index) and every
+question is answered by ExtractiveAnswerer with both thresholds at zero. A
+quote counts as correct when it contains every expected term. The script
+prints each question's top score, margin and verdict, then the
+EXTRACTIVE_MIN_SCORE / EXTRACTIVE_MIN_MARGIN that admit the most correct
+quotes without admitting a wrong one.
+
+    python calibrate_extractive.py
+    python calibrate_extractive.py --pdf book.pdf --questions my_questions.txt
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from extractive import ExtractiveAnswerer
+from pdf_index import build_pdf_index
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PDF = os.path.join(HERE, '..', 'NirvanBhagabati', '1-Week1CommonTask', 'ncert.pdf')
+DEFAULT_QUESTIONS = os.path.join(HERE, 'extractive_calibration.txt')
+
+
+def load_cases(path):
+    """
+    Reads (question, expected terms) pairs from a calibration file.
+    """
+    cases = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            question, _, expected = line.partition('|')
+            terms = [term.strip().lower() for term in expected.split(';') if term.strip()]
+            cases.append((question.strip(), terms))
+    return cases
+
+
+def measure(retriever, cases):
+    """
+    Answers every question with the thresholds disabled.
+
+    Returns:
+        list: One dict per question with its top score, margin, quote and whether
+        the quote is correct (None when nothing could be quoted)
+    """
+    answerer = ExtractiveAnswerer(min_score=0.0, min_margin=0.0)
+    rows = []
+    for question, terms in cases:
+        hit = answerer.answer(question, retriever.retrieve(question))
+        row = {'question': question, 'top_score': 0.0, 'margin': 0.0, 'quote': None, 'correct': None}
+        if hit is not None:
+            quote = hit.answer.lower()
+            row.update(top_score=hit.top_score, margin=hit.margin, quote=hit.answer,
+                       correct=all(term in quote for term in terms))
+        rows.append(row)
+    return rows
+
+
+def choose_thresholds(rows):
+    """
+    Picks the thresholds that admit the most correct quotes and no wrong one.
+
+    Returns:
+        tuple or None: (min_score, min_margin, correct quotes admitted), or None
+        when no threshold admits a correct quote without a wrong one
+
+    How it works:
+    - Candidate thresholds are the scores and margins of the correct quotes
+    - Among equally good pairs the strictest is taken, so the result sits on the
+      data; pick defaults between it and the best wrong quote it still rejects
+    """
+    correct = [row for row in rows if row['correct']]
+    wrong = [row for row in rows if row['correct'] is False]
+    best = None
+    for min_score in {row['top_score'] for row in correct}:
+        for min_margin in {row['margin'] for row in correct}:
+            def admitted(row):
+                return row['top_score'] >= min_score and row['margin'] >= min_margin
+            if any(admitted(row) for row in wrong):
+                continue
+            candidate = (sum(1 for row in correct if admitted(row)), min_score, min_margin)
+            if best is None or candidate > best:
+                best = candidate
+    if best is None:
+        return None
+    count, min_score, min_margin = best
+    return min_score, min_margin, count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calibrate the extractive fast path thresholds.')
+    parser.add_argument('--pdf', default=DEFAULT_PDF, help='PDF to index')
+    parser.add_argument('--questions', default=DEFAULT_QUESTIONS, help='Calibration questions file')
+    args = parser.parse_args(argv)
+
+    # build_pdf_index writes its sidecar next to the PDF, so index a throwaway copy
+    workdir = tempfile.mkdtemp(prefix='calibrate_extractive-')
+    try:
+        pdf_copy = os.path.join(workdir, os.path.basename(args.pdf))
+        shutil.copyfile(args.pdf, pdf_copy)
+        _, retriever = build_pdf_index(pdf_copy)
+        rows = measure(retriever, load_cases(args.questions))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print('top_score\tmargin\tverdict\tquestion')
+    for row in sorted(rows, key=lambda row: -row['top_score']):
+        verdict = {True: 'correct', False: 'wrong', None: 'no quote'}[row['correct']]
+        print(f"{row['top_score']:.2f}\t{row['margin']:.2f}\t{verdict}\t{row['question']}")
+
+    wrong = [row for row in rows if row['correct'] is False]
+    if wrong:
+        worst = max(wrong, key=lambda row: row['top_score'])
+        print(f"\nHighest-scoring wrong quote: top_score {worst['top_score']:.2f}, margin {worst['margin']:.2f}")
+    chosen = choose_thresholds(rows)
+    if chosen is None:
+        print('No thresholds admit a correct quote without a wrong one; keep EXTRACTIVE_MODE off.')
+        return 1
+    min_score, min_margin, count = chosen
+    print(f'Strictest thresholds admitting {count} of {len(rows)} questions with no wrong quote: '
+          f'EXTRACTIVE_MIN_SCORE={min_score:.2f} EXTRACTIVE_MIN_MARGIN={min_margin:.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
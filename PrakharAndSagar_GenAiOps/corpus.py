@@ -0,0 +1,49 @@
+"""
+Corpus mode for the PDF Q&A app: one question across many uploaded PDFs.
+
+Every uploaded PDF already has its own BM25 index (its sidecar, see
+pdf_index.py), which serves as one shard of the corpus. A question fans out
+to all shards on a thread pool and the per-shard hits are merged into a
+single global top-k before synthesis. Adding a document therefore only
+builds that document's shard; the rest of the corpus is untouched.
+"""
+
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core.base.base_retriever import BaseRetriever
+
+
+class ShardedBM25Retriever(BaseRetriever):
+    """
+    Retriever that searches several BM25 shards in parallel and merges their results.
+
+    Args:
+        shards (list): BM25Retriever instances, one per document
+        executor (ThreadPoolExecutor): Pool the per-shard searches run on
+        similarity_top_k (int): Number of nodes returned after merging
+
+    Scores are compared as-is across shards. BM25 statistics are per shard,
+    so this is an approximation, but the top hits of each document keep their
+    relative order and every shard contributes its best candidates.
+    """
+
+    def __init__(self, shards, executor, similarity_top_k=3):
+        self.shards = list(shards)
+        self.executor = executor
+        self.similarity_top_k = similarity_top_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        futures = [self.executor.submit(shard.retrieve, query_bundle) for shard in self.shards]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return heapq.nlargest(self.similarity_top_k, results, key=lambda node: node.score or 0.0)
+
+
+def make_shard_executor(max_workers):
+    """
+    Creates the thread pool shared by every corpus-mode query.
+    """
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard')
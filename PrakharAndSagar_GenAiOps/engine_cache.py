@@ -0,0 +1,149 @@
+"""
+Process-wide cache of query engines for the PDF Q&A app.
+
+Building a query engine means reading the PDF, splitting it into chunks and
+indexing every chunk with BM25. That work only depends on the bytes of the
+PDF and the name it was uploaded as (the chunks record their file name), so
+engines are cached under the file's path and SHA-256 and reused for every
+follow-up question on the same document.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    """
+    Computes the SHA-256 hex digest of a file.
+
+    Args:
+        path (str): Path of the file to hash
+        block_size (int): Number of bytes read per iteration
+
+    Returns:
+        str: Hex digest of the file contents
+
+    How it works:
+    - Reads the file in fixed-size blocks so large PDFs are never loaded into memory at once
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def estimate_bm25_bytes(retriever):
+    """
+    Estimates how much memory a BM25Retriever holds on to.
+
+    Args:
+        retriever (BM25Retriever): The retriever to measure
+
+    Returns:
+        int: Approximate size in bytes
+
+    How it works:
+    - Counts the text and metadata of every stored chunk in the corpus
+    - Adds the size of the numpy arrays backing the BM25 score matrix
+    """
+    size = 0
+    for node_dict in retriever.corpus or []:
+        for value in node_dict.values():
+            size += len(str(value))
+    scores = getattr(retriever.bm25, 'scores', None) or {}
+    for array in scores.values():
+        size += getattr(array, 'nbytes', 0)
+    return size
+
+
+class EngineCache:
+    """
+    Thread-safe LRU cache of query engines bounded by an approximate memory budget.
+
+    Each entry is stored with its estimated size in bytes. When adding an entry
+    pushes the total over `max_bytes`, the least recently used engines are
+    evicted until the cache fits again. An engine larger than the whole budget
+    is still returned to the caller but never stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (engine, size_bytes)
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """
+        Returns the cached engine for `key` and marks it as recently used, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, engine, size_bytes):
+        """
+        Stores an engine, evicting least recently used entries to stay within budget.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if size_bytes > self.max_bytes:
+                return
+            self._entries[key] = (engine, size_bytes)
+            self.total_bytes += size_bytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get_or_build(self, key, builder):
+        """
+        Returns the cached engine for `key`, building it on a miss.
+
+        Args:
+            key (hashable): Cache key, normally the PDF's (path, SHA-256)
+            builder (callable): Called with no arguments on a miss; must return
+                a tuple of (engine, size_bytes)
+
+        Returns:
+            The cached or freshly built engine
+
+        How it works:
+        - A per-key lock makes concurrent requests for the same PDF wait for a
+          single build instead of ingesting the document several times
+        - Requests for other PDFs are not blocked while a build runs
+        """
+        engine = self.get(key)
+        if engine is not None:
+            return engine
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            engine = self.get(key)
+            if engine is None:
+                engine, size_bytes = builder()
+                self.put(key, engine, size_bytes)
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return engine
+
+    def clear(self):
+        """
+        Drops every cached engine.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
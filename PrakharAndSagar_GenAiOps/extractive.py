@@ -0,0 +1,141 @@
+"""
+Extractive fast path: answer from the top BM25 chunk without calling the LLM.
+
+For definition-style questions ("state Ohm's law") the best BM25 chunk often
+holds the answer verbatim. When the top score clears `min_score` and beats
+the runner-up by a relative `min_margin`, the sentences of that chunk sharing
+the most terms with the question are returned as the answer. Otherwise the
+caller falls back to LLM synthesis as usual.
+
+BM25 scores depend on the corpus and on question length, so the thresholds
+need calibrating: calibrate_extractive.py answers a file of sample questions
+with known answers and reports the thresholds that admit the most correct
+quotes without a wrong one. The defaults come from running it on the sample
+NCERT chapter (extractive_calibration.txt): every quote scoring 3.0 or more
+(margins 0.23 and up) was correct and no wrong one scored above 2.58, so
+min_score=2.8 and min_margin=0.2 sit in that gap.
+"""
+
+import re
+import threading
+
+try:
+    from bm25s.stopwords import STOPWORDS_EN
+except ImportError:
+    STOPWORDS_EN = ()
+
+try:
+    import Stemmer  # PyStemmer, the stemmer BM25Retriever uses by default
+except ImportError:
+    Stemmer = None
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\w\w+")
+
+
+class ExtractiveResult:
+    """
+    A fast-path answer: the quoted sentences and the node they came from.
+    """
+
+    def __init__(self, answer, node, top_score, margin):
+        self.answer = answer
+        self.node = node
+        self.top_score = top_score
+        self.margin = margin
+
+
+class ExtractiveAnswerer:
+    """
+    Decides per question whether the top BM25 hit can be quoted instead of synthesized.
+
+    Args:
+        min_score (float): Smallest top BM25 score accepted
+        min_margin (float): Smallest (top - second) / top accepted
+        max_sentences (int): Most sentences quoted from the top chunk
+        language (str): Stemmer language; sentences are matched on the same
+            English stems BM25Retriever uses by default
+
+    Counts how often the fast path fires; see stats().
+    """
+
+    def __init__(self, min_score=2.8, min_margin=0.2, max_sentences=2, language="english"):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.max_sentences = max_sentences
+        self.language = language
+        self.fired = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        # PyStemmer objects are not thread-safe, so each thread gets its own
+        self._local = threading.local()
+
+    def _terms(self, text):
+        words = [w for w in WORD.findall(text.lower()) if w not in STOPWORDS_EN]
+        if Stemmer is not None:
+            stemmer = getattr(self._local, "stemmer", None)
+            if stemmer is None:
+                stemmer = self._local.stemmer = Stemmer.Stemmer(self.language)
+            words = stemmer.stemWords(words)
+        return set(words)
+
+    def _count(self, fired):
+        with self._lock:
+            if fired:
+                self.fired += 1
+            else:
+                self.fallbacks += 1
+
+    def answer(self, question, nodes):
+        """
+        Return an ExtractiveResult, or None when the caller should synthesize.
+
+        `nodes` are the retriever's hits, best first.
+        """
+        result = self._extract(question, nodes)
+        self._count(result is not None)
+        return result
+
+    def _extract(self, question, nodes):
+        if not nodes:
+            return None
+        top_score = nodes[0].score or 0.0
+        second = (nodes[1].score or 0.0) if len(nodes) > 1 else 0.0
+        margin = (top_score - second) / top_score if top_score > 0 else 0.0
+        if top_score < self.min_score or margin < self.min_margin:
+            return None
+
+        query_terms = self._terms(question)
+        if not query_terms:
+            return None
+        # PDF text breaks lines mid-sentence; normalise whitespace before splitting
+        text = " ".join(nodes[0].node.get_content().split())
+        sentences = SENTENCE_END.split(text)
+        scored = []
+        for position, sentence in enumerate(sentences):
+            # Textbook exercise questions echo the query but never answer it
+            if sentence.endswith("?"):
+                continue
+            overlap = len(query_terms & self._terms(sentence))
+            if overlap:
+                scored.append((overlap, -position, sentence))
+        if not scored:
+            return None
+        best = sorted(scored, reverse=True)[:self.max_sentences]
+        # Quote the chosen sentences in document order
+        quoted = " ".join(sentence for _, _, sentence in sorted(best, key=lambda item: -item[1]))
+        return ExtractiveResult(quoted, nodes[0], top_score, margin)
+
+    def stats(self):
+        """
+        Return how many questions took the fast path and how many fell back to synthesis.
+        """
+        with self._lock:
+            total = self.fired + self.fallbacks
+            return {
+                "extractive": self.fired,
+                "synthesized": self.fallbacks,
+                "fast_path_rate": self.fired / total if total else 0.0,
+                "min_score": self.min_score,
+                "min_margin": self.min_margin,
+            }
@@ -0,0 +1,164 @@
+"""
+Server-side chat history for the PDF Q&A app.
+
+The browser session cookie only carries a random session id; the questions
+and rendered answers live here, so requests no longer ship the whole growing
+history back and forth. Two backends are available:
+
+- MemoryHistoryStore: per-process, keeps the most recently active sessions (LRU)
+- SQLiteHistoryStore: survives restarts and is shared by every worker on the host
+
+Both keep at most `max_turns` turns per session and serve them in pages.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class HistoryStore:
+    """
+    Interface shared by the history backends.
+
+    A turn is a dict with 'question' and 'answer' (rendered HTML) keys.
+    """
+
+    def append(self, session_id, question, answer):
+        """
+        Adds a turn to the end of a session's history, dropping the oldest past `max_turns`.
+        """
+        raise NotImplementedError
+
+    def page(self, session_id, page=1, page_size=10):
+        """
+        Returns one page of a session's history.
+
+        Args:
+            session_id (str): The session to read
+            page (int): 1 is the most recent page, 2 the one before it, and so on
+            page_size (int): Turns per page
+
+        Returns:
+            tuple: (turns oldest-first, total number of stored turns)
+        """
+        raise NotImplementedError
+
+    def clear(self, session_id):
+        """
+        Deletes a session's history.
+        """
+        raise NotImplementedError
+
+
+class MemoryHistoryStore(HistoryStore):
+    """
+    In-process history store holding up to `max_sessions` sessions, least recently used evicted first.
+    """
+
+    def __init__(self, max_turns=50, max_sessions=1000):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> deque of turns
+        self._lock = threading.Lock()
+
+    def append(self, session_id, question, answer):
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is None:
+                turns = self._sessions[session_id] = deque(maxlen=self.max_turns)
+            self._sessions.move_to_end(session_id)
+            turns.append({'question': question, 'answer': str(answer)})
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def page(self, session_id, page=1, page_size=10):
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is None:
+                return [], 0
+            self._sessions.move_to_end(session_id)
+            turns = list(turns)
+        end = max(0, len(turns) - (page - 1) * page_size)
+        return turns[max(0, end - page_size):end], len(turns)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    History store backed by a SQLite file.
+
+    Each thread gets its own connection, as sqlite3 connections must not be
+    shared between threads.
+    """
+
+    def __init__(self, db_path='chat_history.db', max_turns=50):
+        self.db_path = db_path
+        self.max_turns = max_turns
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_turns ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " session_id TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chat_turns_session ON chat_turns (session_id, id)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def append(self, session_id, question, answer):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO chat_turns (session_id, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, question, str(answer), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM chat_turns WHERE session_id = ? AND id NOT IN ("
+                " SELECT id FROM chat_turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns),
+            )
+
+    def page(self, session_id, page=1, page_size=10):
+        conn = self._connect()
+        total = conn.execute("SELECT COUNT(*) FROM chat_turns WHERE session_id = ?", (session_id,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT question, answer FROM chat_turns WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (session_id, page_size, (page - 1) * page_size),
+        ).fetchall()
+        turns = [{'question': question, 'answer': answer} for question, answer in reversed(rows)]
+        return turns, total
+
+    def clear(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+
+
+def make_history_store(backend='memory', db_path='chat_history.db', max_turns=50, max_sessions=1000):
+    """
+    Creates the history store selected by configuration.
+
+    Args:
+        backend (str): 'memory' or 'sqlite'
+        db_path (str): SQLite file, only used by the sqlite backend
+        max_turns (int): Turns kept per session
+        max_sessions (int): Sessions kept in memory, only used by the memory backend
+
+    Returns:
+        HistoryStore: The configured store
+    """
+    if backend == 'memory':
+        return MemoryHistoryStore(max_turns=max_turns, max_sessions=max_sessions)
+    if backend == 'sqlite':
+        return SQLiteHistoryStore(db_path=db_path, max_turns=max_turns)
+    raise ValueError(f"Unknown history backend: {backend!r} (expected 'memory' or 'sqlite')")
@@ -0,0 +1,115 @@
+"""
+Background ingestion queue for the PDF Q&A app.
+
+Parsing and indexing a large PDF can take a long time, so uploads hand the
+work to a small, bounded pool of worker threads and return a job id at once.
+The page polls the job's status until the index is ready, keeping request
+workers free to answer questions.
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class IngestionQueueFull(Exception):
+    """
+    Raised when too many ingestion jobs are already waiting or running.
+    """
+
+
+class IngestionQueue:
+    """
+    Runs ingestion jobs on a bounded thread pool and tracks their status.
+
+    Args:
+        max_workers (int): Number of jobs that may run at the same time
+        max_pending (int): Maximum number of queued plus running jobs; further
+            submissions raise IngestionQueueFull
+        max_tracked (int): How many finished jobs to remember for status lookups
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, max_tracked=1000):
+        self.max_pending = max_pending
+        self.max_tracked = max_tracked
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> job dict
+        self._latest_by_key = {}    # key (e.g. PDF path) -> most recent job_id
+
+    def submit(self, key, fn, *args):
+        """
+        Queues `fn(*args)` and returns its job id without waiting for it.
+
+        Args:
+            key (str): What the job works on, normally the PDF path; used by wait()
+            fn (callable): The ingestion function to run in the background
+            *args: Arguments passed to `fn`
+
+        Returns:
+            str: The new job id
+
+        Raises:
+            IngestionQueueFull: If `max_pending` jobs are already queued or running
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job['status'] in (QUEUED, RUNNING))
+            if pending >= self.max_pending:
+                raise IngestionQueueFull(f"{pending} ingestion jobs are already pending")
+            job_id = secrets.token_urlsafe(12)
+            job = {'job_id': job_id, 'key': key, 'status': QUEUED, 'error': None, 'future': None}
+            self._jobs[job_id] = job
+            self._latest_by_key[key] = job_id
+            self._forget_old_jobs()
+            job['future'] = self._executor.submit(self._run, job, fn, args)
+        return job_id
+
+    def _run(self, job, fn, args):
+        with self._lock:
+            job['status'] = RUNNING
+        try:
+            fn(*args)
+        except Exception as e:
+            with self._lock:
+                job['status'] = FAILED
+                job['error'] = str(e)
+            return
+        with self._lock:
+            job['status'] = DONE
+
+    def _forget_old_jobs(self):
+        # Called with the lock held; only finished jobs are ever dropped
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_tracked)]:
+            job = self._jobs.pop(job_id)
+            if self._latest_by_key.get(job['key']) == job_id:
+                del self._latest_by_key[job['key']]
+
+    def status(self, job_id):
+        """
+        Returns {'job_id', 'status', 'error'} for a job, or None if it is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {'job_id': job_id, 'status': job['status'], 'error': job['error']}
+
+    def wait(self, key, timeout=None):
+        """
+        Blocks until the most recent job for `key` has finished, if there is one.
+
+        Lets a question that arrives before indexing completes reuse the
+        running job instead of ingesting the same PDF a second time.
+        """
+        with self._lock:
+            job = self._jobs.get(self._latest_by_key.get(key))
+            future = job['future'] if job else None
+        if future is not None:
+            future.result(timeout=timeout)
@@ -1,6 +1,9 @@
-from flask import Flask, render_template_string, request, session
+from flask import Flask, Response, jsonify, render_template_string, request, session
 from werkzeug.utils import secure_filename
 import os
+import json
+import shutil
+import time
 import dotenv
 
 dotenv.load_dotenv()
@@ -10,18 +13,24 @@ import google.generativeai as genai
 genai.configure(api_key=gemini_api_key)
 
 
-from llama_index.core import SimpleDirectoryReader
-from llama_index.core.node_parser import SentenceSplitter
 from llama_index.llms.google_genai import GoogleGenAI
-from llama_index.retrievers.bm25 import BM25Retriever
 from llama_index.core import get_response_synthesizer
 from llama_index.core.response_synthesizers import ResponseMode
 from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import QueryBundle
 
 import markdown
 from markupsafe import Markup
 import secrets
 
+from engine_cache import EngineCache, estimate_bm25_bytes
+from pdf_index import SIMILARITY_TOP_K, build_pdf_index, index_dir_for, load_pdf_index, read_index_meta
+from ingest_jobs import IngestionQueue, IngestionQueueFull
+from history_store import make_history_store
+from metrics import count_answer, observe_stage, render_metrics, server_timing_header, timed
+from corpus import ShardedBM25Retriever, make_shard_executor
+from extractive import ExtractiveAnswerer
+
 """
 Library Dependencies and Their Purposes:
 • Flask: Web framework for building the application's interface and handling HTTP requests
@@ -30,19 +39,65 @@ Library Dependencies and Their Purposes:
 • dotenv: Manages environment variables and API key security
 • google.generativeai: Enables integration with Google's Gemini AI model
 • llama_index: Core components for document processing and retrieval:
-  - SimpleDirectoryReader: Reads and processes PDF documents
-  - SentenceSplitter: Breaks documents into manageable chunks
   - GoogleGenAI: Integrates with Google's AI models
-  - BM25Retriever: Implements BM25 algorithm for document retrieval
   - ResponseSynthesizer: Generates coherent responses from retrieved information
 • markdown: Converts markdown text to HTML for better response formatting
 • markupsafe: Ensures safe HTML rendering in templates
+• engine_cache: Keeps built query engines in memory, keyed by each PDF's path and SHA-256
+• pdf_index: Parses, chunks and BM25-indexes PDFs (SimpleDirectoryReader, SentenceSplitter,
+  BM25Retriever) and persists the index as a sidecar next to each upload
+• ingest_jobs: Runs PDF ingestion on a bounded background worker pool with pollable job status
+• history_store: Keeps chat history on the server (in memory or SQLite), keyed by a session id
+• metrics: Times each pipeline stage and exposes the durations as Prometheus histograms
+• corpus: Searches every uploaded PDF's BM25 index as a shard in parallel and merges the hits
+• extractive: Quotes the best-matching sentences of an unambiguous top BM25 hit instead of calling Gemini
 """
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)  # Needed for session, now random each run
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or secrets.token_hex(32)  # Needed for session; random each run unless configured
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
+app.config['ENGINE_CACHE_MAX_BYTES'] = int(os.getenv("ENGINE_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Query engines are shared by every request in this process, so follow-up
+# questions on the same PDF skip reading, chunking and indexing it again
+engine_cache = EngineCache(max_bytes=app.config['ENGINE_CACHE_MAX_BYTES'])
+
+# Uploads only enqueue ingestion; these workers parse and index PDFs in the background
+app.config['INGEST_WORKERS'] = int(os.getenv("INGEST_WORKERS", "2"))
+app.config['INGEST_MAX_PENDING'] = int(os.getenv("INGEST_MAX_PENDING", "16"))
+ingestion_queue = IngestionQueue(
+    max_workers=app.config['INGEST_WORKERS'],
+    max_pending=app.config['INGEST_MAX_PENDING'],
+)
+
+# The session cookie only carries a session id; questions and answers are kept here
+app.config['HISTORY_BACKEND'] = os.getenv("HISTORY_BACKEND", "memory")  # 'memory' or 'sqlite'
+app.config['HISTORY_DB_PATH'] = os.getenv("HISTORY_DB_PATH", "chat_history.db")
+app.config['HISTORY_MAX_TURNS'] = int(os.getenv("HISTORY_MAX_TURNS", "50"))
+app.config['HISTORY_MAX_SESSIONS'] = int(os.getenv("HISTORY_MAX_SESSIONS", "1000"))
+app.config['HISTORY_PAGE_SIZE'] = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+history_store = make_history_store(
+    backend=app.config['HISTORY_BACKEND'],
+    db_path=app.config['HISTORY_DB_PATH'],
+    max_turns=app.config['HISTORY_MAX_TURNS'],
+    max_sessions=app.config['HISTORY_MAX_SESSIONS'],
+)
+
+# Corpus mode searches every uploaded PDF; each PDF's index is one shard, searched on this pool
+app.config['CORPUS_SEARCH_WORKERS'] = int(os.getenv("CORPUS_SEARCH_WORKERS", "8"))
+shard_executor = make_shard_executor(app.config['CORPUS_SEARCH_WORKERS'])
+
+# Set EXTRACTIVE_MODE=1 to quote unambiguous top BM25 hits instead of calling Gemini;
+# the score thresholds depend on the documents, calibrate them with calibrate_extractive.py
+app.config['EXTRACTIVE_MODE'] = os.getenv("EXTRACTIVE_MODE", "0") == "1"
+extractive_answerer = ExtractiveAnswerer(
+    min_score=float(os.getenv("EXTRACTIVE_MIN_SCORE", "2.8")),
+    min_margin=float(os.getenv("EXTRACTIVE_MIN_MARGIN", "0.2")),
+    max_sentences=int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "2")),
+) if app.config['EXTRACTIVE_MODE'] else None
+# Set SERVER_TIMING=1 to add a per-request stage breakdown as a Server-Timing response header
+app.config['SERVER_TIMING'] = os.getenv("SERVER_TIMING", "0") == "1"
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -198,6 +253,22 @@ HTML_FORM = """
                 color: var(--text);
                 padding-left: 28px;
             }
+            .corpus-toggle {
+                display: block;
+                color: var(--text-muted);
+                margin-bottom: 1rem;
+                cursor: pointer;
+            }
+            .history-pager {
+                display: flex;
+                justify-content: center;
+                gap: 1.5rem;
+                color: var(--text-muted);
+            }
+            .history-pager a {
+                color: var(--primary);
+                text-decoration: none;
+            }
             
             .file-info {
                 display: flex;
@@ -277,11 +348,89 @@ HTML_FORM = """
                 document.querySelector('input[type="submit"], button[type="submit"]').disabled = false;
             }
             
+            // Streams the answer from /stream and appends tokens as they arrive.
+            // Falls back to the normal (blocking) form submit if the stream cannot start.
+            function streamAnswer(form) {
+                var query = form.querySelector('input[name="query"]').value;
+                var filename = form.querySelector('input[name="filename"]').value;
+                var corpusBox = form.querySelector('input[name="corpus"]');
+                var corpus = corpusBox && corpusBox.checked ? '1' : '';
+                var body = document.getElementById('live-answer-body');
+                var received = false;
+
+                document.getElementById('live-answer-question').textContent = query;
+                body.textContent = '';
+                document.getElementById('live-answer').style.display = 'block';
+                showSpinner();
+
+                var source = new EventSource('/stream?' + new URLSearchParams({filename: filename, query: query, corpus: corpus}));
+                source.onmessage = function(e) {
+                    if (!received) {
+                        received = true;
+                        document.getElementById('spinner').style.display = 'none';
+                    }
+                    body.textContent += JSON.parse(e.data).token;
+                };
+                source.addEventListener('done', function(e) {
+                    var data = JSON.parse(e.data);
+                    source.close();
+                    body.innerHTML = data.html;
+                    hideSpinner();
+                    form.reset();
+                });
+                source.addEventListener('error', function(e) {
+                    source.close();
+                    if (e.data) {
+                        body.innerHTML = JSON.parse(e.data).html;
+                        hideSpinner();
+                    } else if (!received) {
+                        form.onsubmit = null;
+                        form.submit();
+                    } else {
+                        hideSpinner();
+                    }
+                });
+            }
+            
+            // Polls the background ingestion job until the uploaded PDF is indexed,
+            // then enables the question form.
+            function pollIngestion(panel) {
+                var text = document.getElementById('ingest-status-text');
+                var askButton = document.getElementById('ask-button');
+                fetch('/jobs/' + panel.dataset.jobId).then(function(r) {
+                    return r.json();
+                }).then(function(job) {
+                    if (job.status === 'failed') {
+                        panel.querySelector('i').className = 'fas fa-exclamation-triangle';
+                        text.textContent = 'Indexing failed: ' + job.error;
+                    } else if (job.status === 'queued' || job.status === 'running') {
+                        text.textContent = job.status === 'queued' ? 'Waiting for an indexing worker...' : 'Indexing document...';
+                        setTimeout(function() { pollIngestion(panel); }, 1000);
+                    } else {
+                        // done, or forgotten by a restarted server: questions index lazily if needed
+                        panel.style.display = 'none';
+                        askButton.disabled = false;
+                    }
+                }).catch(function() {
+                    setTimeout(function() { pollIngestion(panel); }, 2000);
+                });
+            }
+            
             window.onload = function() {
+                var ingestPanel = document.getElementById('ingest-status');
+                if (ingestPanel) {
+                    pollIngestion(ingestPanel);
+                }
+                
                 var form = document.getElementById('question-form');
                 if (form) {
-                    form.onsubmit = function() {
-                        showSpinner();
+                    form.onsubmit = function(e) {
+                        if (!window.EventSource) {
+                            showSpinner();
+                            return true;
+                        }
+                        e.preventDefault();
+                        streamAnswer(form);
                     }
                 }
                 
@@ -327,6 +476,13 @@ HTML_FORM = """
                     <i class="fas fa-file-pdf"></i>
                     <strong>{{ filename }}</strong>
                 </div>
+
+                {% if job_id %}
+                    <div id="ingest-status" class="file-info" data-job-id="{{ job_id }}">
+                        <i class="fas fa-cog fa-spin"></i>
+                        <span id="ingest-status-text">Indexing document...</span>
+                    </div>
+                {% endif %}
                 
                 <div class="card">
                     <h2><i class="fas fa-question-circle"></i> Ask a Question</h2>
@@ -335,12 +491,28 @@ HTML_FORM = """
                         <div class="input-group">
                             <input type="text" name="query" placeholder="What would you like to know about this document?" required autocomplete="off">
                         </div>
-                        <button type="submit"><i class="fas fa-paper-plane"></i> Ask Question</button>
+                        {% if corpus_size > 1 %}
+                            <label class="corpus-toggle">
+                                <input type="checkbox" name="corpus" value="1">
+                                Search all {{ corpus_size }} uploaded PDFs
+                            </label>
+                        {% endif %}
+                        <button type="submit" id="ask-button" {% if job_id %}disabled{% endif %}><i class="fas fa-paper-plane"></i> Ask Question</button>
                     </form>
                     <div id="spinner" class="spinner"></div>
                 </div>
 
-                {% if chat_history and chat_history|length > 0 %}
+                <div id="live-answer" class="card answer-container markdown-body" style="display: none; margin-top: 0;">
+                    <h3><i class="fas fa-comment-dots"></i> Latest Answer:</h3>
+                    <div class="chat-question">
+                        <i class="fas fa-user"></i> <span id="live-answer-question"></span>
+                    </div>
+                    <div class="chat-answer">
+                        <i class="fas fa-robot"></i> <span id="live-answer-body"></span>
+                    </div>
+                </div>
+
+                {% if chat_history and chat_history|length > 0 and history_page == 1 %}
                     {% set last_chat = chat_history[-1] %}
                     <div class="card answer-container markdown-body" style="margin-top: 0;">
                         <h3><i class="fas fa-comment-dots"></i> Latest Answer:</h3>
@@ -367,6 +539,17 @@ HTML_FORM = """
                             </div>
                         </div>
                     {% endfor %}
+                    {% if history_pages > 1 %}
+                        <div class="history-pager">
+                            {% if history_page < history_pages %}
+                                <a href="?page={{ history_page + 1 }}"><i class="fas fa-arrow-left"></i> Older</a>
+                            {% endif %}
+                            <span>Page {{ history_page }} of {{ history_pages }}</span>
+                            {% if history_page > 1 %}
+                                <a href="?page={{ history_page - 1 }}">Newer <i class="fas fa-arrow-right"></i></a>
+                            {% endif %}
+                        </div>
+                    {% endif %}
                 </div>
             {% endif %}
 
@@ -388,6 +571,15 @@ llm = GoogleGenAI(
     # here, 0.1 means the output will be more deterministic (less random)
 )
 
+# Appended to every question, for both the blocking and the streaming route
+PROMPT_INJECTION = (
+    "You are a helpful assistant.\n"
+    "Answer using information from the provided PDF document.\n"
+    "If the answer is clearly not present in the PDF, reply with 'I don't know based on the PDF.'\n"
+    "Do not use external knowledge or assumptions.\n"
+    "Format your answers using proper Markdown."
+)
+
 def markdown_to_html(md_text):
     """
     Converts markdown text to HTML with proper safety measures.
@@ -405,36 +597,233 @@ def markdown_to_html(md_text):
     """
     return Markup(markdown.markdown(md_text, extensions=['fenced_code', 'tables']))
 
-def process_pdf(pdf_path):
+def make_query_engine(bm25_retriever, streaming=False):
     """
-    Processes a PDF file and creates a query engine for document-based question answering.
+    Wraps a BM25 retriever into a query engine for document-based question answering.
     
     Args:
-        pdf_path (str): Path to the PDF file to be processed
+        bm25_retriever (BM25Retriever): Retriever over the chunks of one PDF
+        streaming (bool): If True, query() returns a response whose response_gen yields tokens
         
     Returns:
         RetrieverQueryEngine: A configured query engine ready to answer questions
         
     How it works:
-    1. Uses SimpleDirectoryReader to load the PDF document
-    2. Splits the document into smaller chunks using SentenceSplitter
-    3. Creates a BM25Retriever for efficient document retrieval
-    4. Configures a response synthesizer with the Gemini model
-    5. Combines retriever and synthesizer into a query engine
-    """
-    reader = SimpleDirectoryReader(input_files=[pdf_path])
-    documents = reader.load_data()
-    text_parser = SentenceSplitter(chunk_size=750, chunk_overlap=50)
-    nodes = text_parser.get_nodes_from_documents(documents)
-    bm25_retriever = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=3)
+    1. Configures a response synthesizer with the Gemini model
+    2. Combines retriever and synthesizer into a query engine
+    """
     response_synthesizer = get_response_synthesizer(
-        llm=llm, response_mode=ResponseMode.COMPACT
+        llm=llm, response_mode=ResponseMode.COMPACT, streaming=streaming
     )
     query_engine = RetrieverQueryEngine(
         retriever=bm25_retriever, response_synthesizer=response_synthesizer
     )
     return query_engine
 
+def engine_cache_key(pdf_path, meta):
+    """
+    Returns the engine cache key of a PDF: its path and the SHA-256 from its sidecar.
+    
+    The path is part of the key because the chunks carry the file name they were
+    parsed from; identical bytes uploaded under two names must not share an engine,
+    or answers about one would cite the other as their source.
+    """
+    return os.path.abspath(pdf_path), meta['sha256']
+
+def process_pdf(pdf_path):
+    """
+    Ingests a freshly uploaded PDF once and warms the engine cache with it.
+    
+    Args:
+        pdf_path (str): Path to the PDF file to be processed
+        
+    Returns:
+        RetrieverQueryEngine: A configured query engine ready to answer questions
+        
+    How it works:
+    1. Parses, chunks and BM25-indexes the PDF with build_pdf_index
+    2. Persists the nodes and term statistics as a sidecar next to the PDF
+    3. Stores the resulting query engine in the cache under the PDF's path and SHA-256
+    """
+    meta, bm25_retriever = build_pdf_index(pdf_path)
+    query_engine = make_query_engine(bm25_retriever)
+    engine_cache.put(engine_cache_key(pdf_path, meta), query_engine, estimate_bm25_bytes(bm25_retriever))
+    return query_engine
+
+def ingest_upload(upload_path, pdf_path):
+    """
+    Moves an accepted upload into place and ingests it.
+    
+    Args:
+        upload_path (str): Temporary file the upload was saved to
+        pdf_path (str): Where the PDF lives once accepted
+        
+    Returns:
+        RetrieverQueryEngine: A configured query engine ready to answer questions
+        
+    How it works:
+    1. Replaces any earlier PDF of the same name with the upload
+    2. Drops that PDF's sidecar index, which no longer describes the file
+    3. Ingests the new PDF with process_pdf
+    """
+    os.replace(upload_path, pdf_path)
+    shutil.rmtree(index_dir_for(pdf_path), ignore_errors=True)
+    return process_pdf(pdf_path)
+
+def get_query_engine(pdf_path):
+    """
+    Returns a query engine for an uploaded PDF without re-ingesting it.
+    
+    Args:
+        pdf_path (str): Path to the PDF file to be queried
+        
+    Returns:
+        RetrieverQueryEngine: A configured query engine ready to answer questions
+        
+    How it works:
+    1. Reads the SHA-256 recorded in the PDF's sidecar index, so the PDF itself is not read
+    2. Looks the PDF's path and hash up in the process-wide engine cache
+    3. On a miss (e.g. after a restart), loads the sidecar index from disk
+    4. PDFs uploaded before sidecars existed are ingested once with process_pdf
+    
+    If the PDF's upload job is still queued or running, this waits for it instead
+    of ingesting the same document a second time.
+    """
+    ingestion_queue.wait(pdf_path)
+    meta = read_index_meta(pdf_path)
+    if meta is None:
+        return process_pdf(pdf_path)
+
+    def build():
+        bm25_retriever = load_pdf_index(pdf_path)
+        return make_query_engine(bm25_retriever), estimate_bm25_bytes(bm25_retriever)
+
+    return engine_cache.get_or_build(engine_cache_key(pdf_path, meta), build)
+
+def list_indexed_pdfs():
+    """
+    Returns the paths of all uploaded PDFs whose sidecar index is ready, sorted by name.
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith('.pdf')]
+    return [path for path in paths if read_index_meta(path) is not None]
+
+def get_corpus_query_engine(streaming=False):
+    """
+    Builds a query engine that searches every indexed PDF at once.
+    
+    Args:
+        streaming (bool): Passed through to make_query_engine
+        
+    Returns:
+        RetrieverQueryEngine: Engine whose retriever fans out over one BM25 shard per PDF
+        
+    How it works:
+    1. Lists the uploaded PDFs that have a sidecar index
+    2. Keeps one PDF per SHA-256, so a file uploaded under several names is one shard
+       and its chunks don't fill the top-k several times over
+    3. Fetches each PDF's retriever through get_query_engine, so shards come from the
+       engine cache and only uncached ones are loaded from disk (in parallel)
+    4. Wraps them in a ShardedBM25Retriever that merges the per-shard hits into a global top-k
+    """
+    pdf_paths = {}
+    for pdf_path in list_indexed_pdfs():
+        meta = read_index_meta(pdf_path)
+        if meta is not None:
+            pdf_paths.setdefault(meta['sha256'], pdf_path)
+    pdf_paths = list(pdf_paths.values())
+    if not pdf_paths:
+        raise ValueError("No indexed PDFs yet. Upload one first.")
+    shards = [engine.retriever for engine in shard_executor.map(get_query_engine, pdf_paths)]
+    retriever = ShardedBM25Retriever(shards, shard_executor, similarity_top_k=SIMILARITY_TOP_K)
+    return make_query_engine(retriever, streaming=streaming)
+
+def format_sources(nodes):
+    """
+    Returns a Markdown line naming the PDFs an answer drew on, for corpus-mode answers.
+    """
+    names = []
+    for node in nodes:
+        name = node.node.metadata.get('file_name')
+        if name and name not in names:
+            names.append(name)
+    return f"\n\n*Sources: {', '.join(names)}*" if names else ""
+
+def retrieval_query(query_text):
+    """
+    Returns the query used to retrieve context for a question.
+    
+    With the extractive fast path on, chunks are retrieved with the bare question:
+    the prompt instructions appended for synthesis would add the same words to every
+    search and blur the score margin it relies on. The same hits then feed synthesis
+    when the fast path declines, so a question is only ever searched once.
+    """
+    if extractive_answerer is None:
+        return QueryBundle(query_text + "\n\n" + PROMPT_INJECTION)
+    return QueryBundle(query_text)
+
+def extractive_answer(query_text, nodes):
+    """
+    Tries to answer a question by quoting the top BM25 hit, without calling Gemini.
+    
+    Args:
+        query_text (str): The user's question, without the prompt instructions
+        nodes (list): The hits retrieved for retrieval_query(query_text)
+        
+    Returns:
+        str or None: Markdown answer quoting the source, or None to fall back to synthesis
+        
+    How it works:
+    - ExtractiveAnswerer accepts the top hit only if its score and margin clear the thresholds
+    - The quote names the PDF (and page) it was taken from
+    """
+    if extractive_answerer is None:
+        return None
+    with timed('extractive'):
+        hit = extractive_answerer.answer(query_text, nodes)
+    if hit is None:
+        return None
+    metadata = hit.node.node.metadata
+    source = metadata.get('file_name', 'the PDF')
+    if metadata.get('page_label'):
+        source = f"page {metadata['page_label']} of {source}"
+    return f"> {hit.answer}\n\n*Quoted from {source}*"
+
+def get_session_id():
+    """
+    Returns the id that keys this browser session's chat history, creating one if needed.
+    """
+    if 'sid' not in session:
+        session['sid'] = secrets.token_urlsafe(16)
+    return session['sid']
+
+def render_page(filename=None, answer=None, job_id=None):
+    """
+    Renders HTML_FORM with one page of the session's chat history.
+    
+    Args:
+        filename (str): The uploaded PDF, if any
+        answer (Markup): An answer or error message to show
+        job_id (str): Ingestion job the page should poll, if any
+        
+    Returns:
+        str: Rendered HTML template
+        
+    How it works:
+    - Reads the ?page= query parameter (1 is the most recent page)
+    - Loads only that page of turns from history_store
+    - Counts the indexed PDFs so the corpus-mode checkbox can be offered
+    """
+    page_size = app.config['HISTORY_PAGE_SIZE']
+    history_page = max(1, request.args.get('page', 1, type=int))
+    chat_history, total = history_store.page(get_session_id(), history_page, page_size)
+    history_pages = max(1, -(-total // page_size))
+    return render_template_string(
+        HTML_FORM, filename=filename, answer=answer, job_id=job_id,
+        chat_history=chat_history, history_page=history_page, history_pages=history_pages,
+        corpus_size=len(list_indexed_pdfs()) if filename else 0,
+    )
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_and_query_pdf():
     """
@@ -449,7 +838,10 @@ def upload_and_query_pdf():
     Handles two types of POST requests:
     1. PDF Upload:
        - Validates the uploaded file is a PDF
-       - Securely saves the file
+       - Securely saves the file under a temporary name
+       - Queues a background job that moves it into place, builds the BM25 index once and persists it next to the PDF
+       - If the queue is full, discards the upload and answers 503, leaving any earlier PDF of that name untouched
+       - Returns immediately; the page polls /jobs/<job_id> until the index is ready
        - Resets chat history
        - Returns the question form interface
     
@@ -457,12 +849,16 @@ def upload_and_query_pdf():
        - Processes the user's question about the PDF
        - Uses the query engine to find relevant information
        - Formats the response in markdown
+       - With "Search all uploaded PDFs" ticked (corpus=1), searches every indexed PDF
        - Updates chat history
        - Returns the answer with updated interface
     
+    Answers are normally streamed through /stream by the page's script;
+    the blocking question branch remains the fallback for browsers without EventSource.
+    
     Session Management:
-    - Maintains chat history across requests
-    - Stores the current filename
+    - The cookie holds only a session id, the current filename and the ingestion job id
+    - Chat history is kept server-side in history_store and rendered one page at a time (?page=N)
     - Handles error cases gracefully
     
     Returns:
@@ -470,7 +866,6 @@ def upload_and_query_pdf():
     """
     filename = None
     answer = None
-    chat_history = session.get('chat_history', [])
 
     if request.method == 'POST':
         if 'pdf_file' in request.files:
@@ -478,47 +873,182 @@ def upload_and_query_pdf():
             if file and file.filename.endswith('.pdf'):
                 filename = secure_filename(file.filename) # we use secure_filename to avoid directory traversal attacks
                 save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(save_path)
+                # Saved under a temporary name and moved into place by the job, so a rejected
+                # upload never replaces a PDF whose sidecar index is still in use
+                upload_path = f"{save_path}.{secrets.token_hex(8)}.upload"
+                file.save(upload_path)
+                try:
+                    job_id = ingestion_queue.submit(save_path, ingest_upload, upload_path, save_path)
+                except IngestionQueueFull:
+                    os.remove(upload_path)
+                    answer = markdown_to_html("**The server is busy indexing other documents.** Please try the upload again in a minute.")
+                    return render_page(filename=None, answer=answer), 503
                 session['filename'] = filename
-                session['chat_history'] = []
-                chat_history = []
-                return render_template_string(HTML_FORM, filename=filename, chat_history=chat_history)
+                session['ingest_job'] = job_id
+                history_store.clear(get_session_id())
+                return render_page(filename=filename, job_id=job_id)
             else:
                 answer = markdown_to_html("**Please upload a valid PDF file.**")
-                return render_template_string(HTML_FORM, filename=None, answer=answer, chat_history=chat_history)
+                return render_page(filename=None, answer=answer)
 
         elif request.form.get('query') and request.form.get('filename'):
             query_text = request.form.get('query')
-            PROMPT_INJECTION = (
-                "You are a helpful assistant.\n"
-                "Answer using information from the provided PDF document.\n"
-                "If the answer is clearly not present in the PDF, reply with 'I don't know based on the PDF.'\n"
-                "Do not use external knowledge or assumptions.\n"
-                "Format your answers using proper Markdown."
-            )
             query_text2 = query_text+"\n\n" + PROMPT_INJECTION
 
             filename = request.form.get('filename')
+            corpus = request.form.get('corpus') == '1'
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if not os.path.exists(file_path):
+            if not corpus and not os.path.exists(file_path):
                 answer = markdown_to_html(f"**Error:** File `{filename}` not found. Try re-uploading?")
-                return render_template_string(HTML_FORM, filename=filename, answer=answer, chat_history=chat_history)
+                return render_page(filename=filename, answer=answer)
             try:
-                query_engine = process_pdf(file_path)
-                response = query_engine.query(query_text2)
-                md_answer = response.response
+                query_engine = get_corpus_query_engine() if corpus else get_query_engine(file_path)
+                with timed('retrieval'):
+                    nodes = query_engine.retrieve(retrieval_query(query_text))
+                md_answer = extractive_answer(query_text, nodes)
+                if md_answer is not None:
+                    count_answer('extractive')
+                else:
+                    query_bundle = QueryBundle(query_text2)
+                    with timed('synthesis'):
+                        response = query_engine.synthesize(query_bundle, nodes)
+                    count_answer('synthesized')
+                    md_answer = response.response
+                    if corpus:
+                        md_answer += format_sources(nodes)
                 html_answer = markdown_to_html(md_answer)
-                chat_history.append({'question': query_text, 'answer': html_answer})
-                session['chat_history'] = chat_history
+                history_store.append(get_session_id(), query_text, html_answer)
                 answer = html_answer
             except Exception as e:
                 answer = markdown_to_html(f"**Oops! Something went wrong:** `{e}`. Maybe try a different query or PDF?")
-            return render_template_string(HTML_FORM, filename=filename, answer=answer, chat_history=chat_history)
+            return render_page(filename=filename, answer=answer)
     else:
         filename = session.get('filename')
-        chat_history = session.get('chat_history', [])
+        return render_page(filename=filename, job_id=session.get('ingest_job'))
+
+    return render_page(filename=filename, answer=answer)
+
+def sse_event(data, event=None):
+    """
+    Formats one Server-Sent Event.
+    
+    Args:
+        data (dict): Payload, sent JSON-encoded so tokens containing newlines survive
+        event (str): Optional event name; unnamed events reach the client's onmessage handler
+        
+    Returns:
+        str: The event in text/event-stream wire format
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.route('/stream')
+def stream_answer():
+    """
+    Streams the answer to a question over Server-Sent Events as Gemini generates it.
+    
+    Query Parameters:
+        filename (str): Name of an uploaded PDF
+        query (str): The user's question
+        corpus (str): '1' to search every indexed PDF instead of just `filename`
+        
+    Events:
+    - unnamed: {"token": ...} for every piece of text produced by the synthesizer
+    - done: {"html": ...} with the full answer rendered from Markdown, which has
+      already been added to the session's chat history
+    - error: {"html": ...} with a rendered error message
+    
+    Returns:
+        Response: A text/event-stream response, or 400/404 when the request is unusable
+        (the page then falls back to the blocking form submit)
+    """
+    query_text = request.args.get('query', '').strip()
+    filename = secure_filename(request.args.get('filename', ''))
+    if not query_text or not filename:
+        return Response("Missing query or filename", status=400)
+    corpus = request.args.get('corpus') == '1'
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not corpus and not os.path.exists(file_path):
+        return Response(f"File {filename} not found", status=404)
+    session_id = get_session_id()
+
+    def generate():
+        try:
+            if corpus:
+                query_engine = get_corpus_query_engine(streaming=True)
+            else:
+                query_engine = make_query_engine(get_query_engine(file_path).retriever, streaming=True)
+            with timed('retrieval'):
+                nodes = query_engine.retrieve(retrieval_query(query_text))
+            md_answer = extractive_answer(query_text, nodes)
+            if md_answer is not None:
+                count_answer('extractive')
+                yield sse_event({'token': md_answer})
+            else:
+                query_bundle = QueryBundle(query_text + "\n\n" + PROMPT_INJECTION)
+                synthesis_start = time.perf_counter()
+                response = query_engine.synthesize(query_bundle, nodes)
+                parts = []
+                for token in response.response_gen:
+                    if not parts:
+                        observe_stage('synthesis_first_token', time.perf_counter() - synthesis_start)
+                    parts.append(token)
+                    yield sse_event({'token': token})
+                observe_stage('synthesis', time.perf_counter() - synthesis_start)
+                count_answer('synthesized')
+                md_answer = ''.join(parts)
+                if corpus:
+                    md_answer += format_sources(nodes)
+            html_answer = markdown_to_html(md_answer)
+            history_store.append(session_id, query_text, html_answer)
+            yield sse_event({'html': str(html_answer)}, event='done')
+        except Exception as e:
+            error = markdown_to_html(f"**Oops! Something went wrong:** `{e}`. Maybe try a different query or PDF?")
+            yield sse_event({'html': str(error)}, event='error')
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # stop reverse proxies from buffering the stream
+    })
 
-    return render_template_string(HTML_FORM, filename=filename, answer=answer, chat_history=chat_history)
+@app.route('/jobs/<job_id>')
+def ingestion_job_status(job_id):
+    """
+    Reports the status of a background ingestion job.
+    
+    Returns:
+        Response: JSON {"job_id", "status", "error"} where status is one of
+        queued, running, done or failed; 404 if the job is unknown
+    """
+    job = ingestion_queue.status(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job)
+
+@app.route('/metrics')
+def metrics():
+    """
+    Exposes per-stage latency histograms and answer counts in the Prometheus text format.
+    
+    Stages: pdf_load, chunking, bm25_build, index_persist, index_load,
+    extractive, retrieval, synthesis and (for streamed answers) synthesis_first_token.
+    pdfqa_answers_total{mode="extractive"|"synthesized"} shows how often the
+    extractive fast path answered. Values are per process; scrape every worker.
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Adds a Server-Timing header listing the stages timed during this request, when SERVER_TIMING is enabled.
+    
+    Streamed answers send their headers before retrieval starts, so they carry no breakdown.
+    """
+    if app.config['SERVER_TIMING']:
+        header = server_timing_header()
+        if header:
+            response.headers['Server-Timing'] = header
+    return response
 
 if __name__ == '__main__':    
     print("Starting Flask app on http://127.0.0.1:5000")
@@ -0,0 +1,160 @@
+"""
+Per-stage latency metrics for the PDF Q&A app.
+
+Each stage of answering a question (loading the PDF, chunking, building or
+loading the BM25 index, retrieval, synthesis) is timed with `timed(stage)`.
+Durations are collected into a Prometheus histogram served by /metrics, and,
+while handling a request, also remembered on `flask.g` so the app can report
+them in a Server-Timing response header. A counter of answers by mode shows
+how often the extractive fast path answered without calling the LLM.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+# Seconds; spans cheap index loads up to slow ingestion of large textbooks
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """
+    Minimal thread-safe Prometheus histogram with a single label.
+
+    Args:
+        name (str): Metric name
+        help_text (str): Description shown in the # HELP line
+        label (str): Name of the label distinguishing series (e.g. 'stage')
+        buckets (tuple): Upper bounds of the buckets, in increasing order
+    """
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        """
+        Records one observation for the series `label_value`.
+        """
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """
+        Returns the histogram in the Prometheus text exposition format.
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_value, series in series_items:
+            label = f'{self.label}="{label_value}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {series[-1]}')
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    """
+    Minimal thread-safe Prometheus counter with a single label.
+    """
+
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}  # label value -> count
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_value, value in items:
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    'pdfqa_stage_duration_seconds',
+    'Time spent in each stage of ingesting PDFs and answering questions.',
+    label='stage',
+)
+
+
+ANSWERS_TOTAL = Counter(
+    'pdfqa_answers_total',
+    'Answers given, by whether they were quoted by the extractive fast path or synthesized by the LLM.',
+    label='mode',
+)
+
+
+def count_answer(mode):
+    """
+    Counts one answer produced in `mode` ('extractive' or 'synthesized').
+    """
+    ANSWERS_TOTAL.inc(mode)
+
+
+def observe_stage(stage, seconds):
+    """
+    Records the duration of a stage in the histogram and, during a request, on flask.g.
+    """
+    STAGE_SECONDS.observe(stage, seconds)
+    if has_request_context():
+        timings = g.setdefault('stage_timings', [])
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage):
+    """
+    Context manager that times the enclosed block as `stage`.
+
+    Works outside a request too (e.g. in background ingestion workers);
+    those timings only go to the histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header():
+    """
+    Builds a Server-Timing header value from the stages timed in the current request.
+
+    Returns:
+        str or None: e.g. 'retrieval;dur=12.3, synthesis;dur=840.1', or None if nothing was timed
+    """
+    timings = g.get('stage_timings')
+    if not timings:
+        return None
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+def render_metrics():
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    return STAGE_SECONDS.render() + ANSWERS_TOTAL.render()
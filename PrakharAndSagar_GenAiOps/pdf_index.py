@@ -0,0 +1,158 @@
+"""
+Builds BM25 indexes for uploaded PDFs and persists them as sidecar artifacts.
+
+Every PDF saved as `uploads/<name>.pdf` gets a sibling directory
+`uploads/<name>.pdf.index/` holding the chunked nodes and the BM25 term
+statistics, plus an `index_meta.json` describing how the index was built.
+Questions and restarts load that directory instead of parsing the PDF again,
+so ingestion is paid once per document.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import Stemmer
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.retrievers.bm25 import BM25Retriever
+
+from engine_cache import file_sha256
+from metrics import observe_stage, timed
+
+INDEX_SUFFIX = '.index'
+META_FILENAME = 'index_meta.json'
+# Bump when the chunking or index layout changes so old sidecars are rebuilt
+INDEX_FORMAT_VERSION = 1
+
+CHUNK_SIZE = 750
+CHUNK_OVERLAP = 50
+SIMILARITY_TOP_K = 3
+
+
+class ThreadSafeBM25Retriever(BM25Retriever):
+    """
+    BM25Retriever that gives every thread its own PyStemmer stemmer.
+
+    Cached retrievers are shared by concurrent Flask requests and by the corpus
+    shard pool, but BM25Retriever stems every query with a single Stemmer
+    object, which is not thread-safe. The index itself is only read, so a
+    per-thread stemmer is all that is needed for concurrent retrieve() calls.
+    """
+
+    @property
+    def stemmer(self):
+        local = self.__dict__.setdefault('_stemmers', threading.local())
+        stemmer = getattr(local, 'stemmer', None)
+        if stemmer is None:
+            stemmer = local.stemmer = Stemmer.Stemmer('english')
+        return stemmer
+
+    @stemmer.setter
+    def stemmer(self, value):
+        # The stemmer handed to __init__ only serves the thread that built the retriever
+        self.__dict__.setdefault('_stemmers', threading.local()).stemmer = value
+
+
+def index_dir_for(pdf_path):
+    """
+    Returns the sidecar index directory that belongs to a PDF.
+    """
+    return pdf_path + INDEX_SUFFIX
+
+
+def read_index_meta(pdf_path):
+    """
+    Reads the metadata of a PDF's sidecar index.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+
+    Returns:
+        dict or None: The metadata, or None when there is no usable sidecar
+
+    How it works:
+    - The metadata file is written last, so its presence means the sidecar is complete
+    - Sidecars written by an older INDEX_FORMAT_VERSION are treated as missing
+    """
+    meta_path = os.path.join(index_dir_for(pdf_path), META_FILENAME)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format_version') != INDEX_FORMAT_VERSION:
+        return None
+    return meta
+
+
+def build_pdf_index(pdf_path):
+    """
+    Parses, chunks and BM25-indexes a PDF, then persists the index next to it.
+
+    Args:
+        pdf_path (str): Path to the PDF file to be processed
+
+    Returns:
+        tuple: (metadata dict, ThreadSafeBM25Retriever) for the freshly built index
+
+    How it works:
+    1. Uses SimpleDirectoryReader to load the PDF document
+    2. Splits the document into smaller chunks using SentenceSplitter
+    3. Creates a BM25Retriever over the chunks
+    4. Writes the nodes and term statistics into a temporary directory
+    5. Swaps the temporary directory into place so readers never see a half-written index
+    """
+    with timed('pdf_load'):
+        reader = SimpleDirectoryReader(input_files=[pdf_path])
+        documents = reader.load_data()
+    with timed('chunking'):
+        text_parser = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        nodes = text_parser.get_nodes_from_documents(documents)
+    if not nodes:
+        raise ValueError("No text could be extracted from the PDF")
+    with timed('bm25_build'):
+        # bm25s rejects a top-k larger than the number of chunks, so very short PDFs
+        # (including small corpus shards) retrieve all of their chunks instead
+        bm25_retriever = ThreadSafeBM25Retriever.from_defaults(nodes=nodes, similarity_top_k=min(SIMILARITY_TOP_K, len(nodes)))
+
+    meta = {
+        'format_version': INDEX_FORMAT_VERSION,
+        'sha256': file_sha256(pdf_path),
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP,
+        'num_nodes': len(nodes),
+    }
+
+    index_dir = index_dir_for(pdf_path)
+    persist_start = time.perf_counter()
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(index_dir) + '.', dir=os.path.dirname(index_dir) or '.')
+    try:
+        bm25_retriever.persist(tmp_dir)
+        with open(os.path.join(tmp_dir, META_FILENAME), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+        os.rename(tmp_dir, index_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    observe_stage('index_persist', time.perf_counter() - persist_start)
+    return meta, bm25_retriever
+
+
+def load_pdf_index(pdf_path):
+    """
+    Loads a PDF's BM25 retriever from its sidecar index without touching the PDF.
+
+    Args:
+        pdf_path (str): Path to the PDF file the index belongs to
+
+    Returns:
+        ThreadSafeBM25Retriever: The retriever restored from disk
+    """
+    with timed('index_load'):
+        return ThreadSafeBM25Retriever.from_persist_dir(index_dir_for(pdf_path))
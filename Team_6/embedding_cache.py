@@ -0,0 +1,230 @@
+"""
+Disk-backed cache for chunk embeddings.
+
+Wrap any LlamaIndex embedding model (e.g. GoogleGenAIEmbedding) in
+CachedEmbedding and every chunk is embedded at most once per model: vectors
+are stored as float16 in a memory-mapped file, keyed by the SHA-256 of the
+chunk text, so re-indexing an unchanged textbook makes no embedding calls.
+
+Layout of a cache directory (one sub-directory per model):
+    <cache_dir>/<model>/meta.json     model name and vector dimension
+    <cache_dir>/<model>/keys.bin      16-byte text digests, one per row
+    <cache_dir>/<model>/vectors.f16   float16 vectors, one row per key
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer per cache directory
+    fcntl = None
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+KEY_BYTES = 16
+
+
+def text_key(text):
+    """
+    Return the 16-byte digest used to look up a chunk's embedding.
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()[:KEY_BYTES]
+
+
+class EmbeddingStore:
+    """
+    Append-only float16 vector store for one embedding model.
+
+    Rows are appended to vectors.f16 before their keys are appended to
+    keys.bin, so every key on disk points at a complete vector. Appends take
+    an exclusive file lock where the platform supports it, so several worker
+    processes can share one cache directory.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self.dim = None
+        self._rows = {}  # key -> row number
+        self._disk_rows = 0  # rows of the files already read into _rows
+        self._vectors = None  # read-only memmap over vectors.f16
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._vectors_path = os.path.join(path, "vectors.f16")
+        self._refresh()
+
+    def _refresh(self):
+        # Pick up every complete row on disk, including rows written by other processes
+        if self.dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self._vectors_path):
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._disk_rows * KEY_BYTES)
+            keys = f.read()
+        vector_rows = os.path.getsize(self._vectors_path) // (2 * self.dim)
+        count = min(self._disk_rows + len(keys) // KEY_BYTES, vector_rows)
+        for offset, row in enumerate(range(self._disk_rows, count)):
+            self._rows.setdefault(keys[offset * KEY_BYTES:(offset + 1) * KEY_BYTES], row)
+        self._disk_rows = count
+        if count:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode="r", shape=(count, self.dim))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once; returns a list with a vector or None per key.
+        """
+        with self._lock:
+            rows = [self._rows.get(key) for key in keys]
+            if None in rows:
+                # Another process may have embedded them since the files were last read
+                self._refresh()
+                rows = [self._rows.get(key) for key in keys]
+            vectors = self._vectors
+        hits = [i for i, row in enumerate(rows) if row is not None]
+        result = [None] * len(keys)
+        if hits:
+            block = np.asarray(vectors[[rows[i] for i in hits]], dtype=np.float32)
+            for i, vector in zip(hits, block):
+                result[i] = vector.tolist()
+        return result
+
+    def put_many(self, keys, vectors):
+        """
+        Append new vectors; keys that are already stored are ignored.
+        """
+        with self._lock:
+            fresh = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in fresh:
+                    fresh[key] = vector
+            if not fresh:
+                return
+            block = np.asarray(list(fresh.values()), dtype=np.float16)
+            if self.dim is None:
+                self.dim = block.shape[1]
+                with open(self._meta_path, "w") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+            with open(self._keys_path, "ab") as keys_file:
+                if fcntl is not None:
+                    fcntl.flock(keys_file, fcntl.LOCK_EX)
+                try:
+                    row_start = keys_file.tell() // KEY_BYTES
+                    # Drop any partial key or vector rows left behind by an interrupted write,
+                    # so the keys appended below line up with their vectors
+                    keys_file.truncate(row_start * KEY_BYTES)
+                    with open(self._vectors_path, "ab") as vectors_file:
+                        vectors_file.truncate(row_start * 2 * self.dim)
+                        vectors_file.write(block.tobytes())
+                    keys_file.write(b"".join(fresh.keys()))
+                    keys_file.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(keys_file, fcntl.LOCK_UN)
+            self._refresh()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that serves chunk embeddings from an on-disk cache.
+
+    Text (document) embeddings are looked up in batches and only the misses are
+    sent to the wrapped model. Query embeddings are passed straight through,
+    since questions rarely repeat and some models embed queries differently.
+
+    Example:
+        Settings.embed_model = CachedEmbedding.wrap(
+            GoogleGenAIEmbedding(model_name="models/embedding-001"),
+            cache_dir="./embedding_cache",
+        )
+    """
+
+    inner: BaseEmbedding
+    _store: EmbeddingStore = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache_dir: str = "./embedding_cache", **kwargs: Any) -> None:
+        kwargs.setdefault("model_name", inner.model_name)
+        kwargs.setdefault("embed_batch_size", inner.embed_batch_size)
+        super().__init__(inner=inner, **kwargs)
+        folder = re.sub(r"[^A-Za-z0-9_.-]+", "_", inner.model_name)
+        self._store = EmbeddingStore(os.path.join(cache_dir, folder), inner.model_name)
+
+    @classmethod
+    def wrap(cls, inner, cache_dir="./embedding_cache"):
+        """
+        Wrap `inner`, or return it unchanged if it is already cached.
+        """
+        if isinstance(inner, cls):
+            return inner
+        return cls(inner, cache_dir=cache_dir)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cached_count(self):
+        return len(self._store)
+
+    def _lookup(self, texts):
+        keys = [text_key(text) for text in texts]
+        embeddings = self._store.get_many(keys)
+        # Deduplicate misses so a chunk repeated within one batch is embedded once
+        misses = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                misses.setdefault(key, text)
+        return keys, embeddings, misses
+
+    def _merge(self, keys, embeddings, misses, new_embeddings):
+        self._store.put_many(list(misses), new_embeddings)
+        by_key = dict(zip(misses, new_embeddings))
+        return [embedding if embedding is not None else list(by_key[key])
+                for key, embedding in zip(keys, embeddings)]
+
+    def get_text_embedding_batch(self, texts: List[str], show_progress: bool = False, **kwargs: Any) -> List[Embedding]:
+        keys, embeddings, misses = self._lookup(texts)
+        new_embeddings = []
+        if misses:
+            new_embeddings = self.inner.get_text_embedding_batch(list(misses.values()), show_progress=show_progress, **kwargs)
+        return self._merge(keys, embeddings, misses, new_embeddings)
+
+    async def aget_text_embedding_batch(self, texts: List[str], show_progress: bool = False) -> List[Embedding]:
+        keys, embeddings, misses = self._lookup(texts)
+        new_embeddings = []
+        if misses:
+            new_embeddings = await self.inner.aget_text_embedding_batch(list(misses.values()), show_progress=show_progress)
+        return self._merge(keys, embeddings, misses, new_embeddings)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self.aget_text_embedding_batch(texts)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self.get_text_embedding_batch([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self.aget_text_embedding_batch([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self.inner.aget_query_embedding(query)
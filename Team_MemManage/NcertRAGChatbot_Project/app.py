@@ -3,11 +3,16 @@
 import streamlit as st
 import google.generativeai as genai
 import os
+import sys
 import requests
 import fitz # PyMuPDF is imported as fitz
 from llama_index.core.schema import Document
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.retrievers.bm25 import BM25Retriever
+from context_budget import ContextPacker
+# Model discovery is shared with the other chatbots and lives in shared/ at the repo root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from shared.gemini_models import GeminiModelResolver
 import time # For initial setup delay if needed
 
 # --- Configuration Constants ---
@@ -17,6 +22,11 @@ DEFAULT_CHUNK_SIZE = 512
 DEFAULT_CHUNK_OVERLAP = 50
 SIMILARITY_TOP_K = 5
 DEFAULT_QUESTION = "What was the Soviet System?"
+# Most context tokens sent to Gemini; only the best sentences of the retrieved chunks are kept (0 = send whole chunks)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+# Resolved Gemini model name, reused for this many seconds before it is looked up again
+GEMINI_MODEL_CACHE_PATH = "gemini_model_cache.json"
+GEMINI_MODEL_CACHE_TTL = float(os.getenv("GEMINI_MODEL_CACHE_TTL", str(24 * 3600)))
 
 # --- Helper Function for PDF Text Extraction ---
 def extract_text_from_pdf_app(file_path):
@@ -74,10 +84,12 @@ def setup_rag_components():
 
 # --- Gemini API Setup (Cached) ---
 @st.cache_resource
-def get_gemini_model():
+def get_model_resolver():
     """
-    Configures the Gemini API and returns a GenerativeModel instance.
-    This function is cached to run only once.
+    Configures the Gemini API and starts resolving which model to use.
+    The choice is cached on disk, so discovery (a walk of the whole model
+    catalogue) only runs in the background when it is missing or older than
+    GEMINI_MODEL_CACHE_TTL. This function is cached to run only once.
     """
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
@@ -85,37 +97,17 @@ def get_gemini_model():
         st.info("You can set it directly in your terminal before running: `export GEMINI_API_KEY='your_key_here'`")
         st.stop() # Stop the Streamlit app if API key is missing
 
-    try:
-        genai.configure(api_key=api_key)
-        available_gemini_models = []
-        for m in genai.list_models():
-            if "generateContent" in m.supported_generation_methods:
-                if "gemini" in m.name.lower() and "vision" not in m.name.lower():
-                    available_gemini_models.append(m.name)
-
-        priority_models = [
-            "models/gemini-1.5-flash-latest",
-            "models/gemini-1.5-flash",
-            "models/gemini-1.5-pro-latest",
-            "models/gemini-1.5-pro",
-            "models/gemini-pro"
-        ]
-
-        model_to_use = None
-        for p_model in priority_models:
-            if p_model in available_gemini_models:
-                model_to_use = p_model
-                break
-
-        if model_to_use:
-            st.success(f"Using Gemini model: **{model_to_use}**")
-            return genai.GenerativeModel(model_to_use)
-        else:
-            st.error("No suitable text-only Gemini model found. Please check your API key and model access.")
-            st.stop()
-    except Exception as e:
-        st.error(f"Error configuring Gemini API or verifying models: {e}. Please check your API key and network.")
-        st.stop()
+    genai.configure(api_key=api_key)
+    resolver = GeminiModelResolver(api_key, cache_path=GEMINI_MODEL_CACHE_PATH, ttl=GEMINI_MODEL_CACHE_TTL)
+    resolver.start()
+    return resolver
+
+def get_gemini_model(model_resolver):
+    """
+    Returns a GenerativeModel for the resolved model name.
+    Waits only if nothing is cached yet and discovery hasn't finished.
+    """
+    return genai.GenerativeModel(model_resolver.model_name())
 
 # --- Main Streamlit UI Layout ---
 st.set_page_config(page_title="📚 NCERT RAG Chatbot", layout="centered")
@@ -133,6 +125,7 @@ with st.sidebar:
     st.write(f"Chunk Size: `{DEFAULT_CHUNK_SIZE}`")
     st.write(f"Chunk Overlap: `{DEFAULT_CHUNK_OVERLAP}`")
     st.write(f"BM25 `similarity_top_k`: `{SIMILARITY_TOP_K}`")
+    st.write(f"Context token budget: `{CONTEXT_TOKEN_BUDGET}`")
 
     # Display a button to clear cache if needed during development
     if st.button("Clear Cache"):
@@ -144,12 +137,14 @@ with st.sidebar:
 # -----------------------------------------------------
 # Initialize RAG and Gemini Model
 # -----------------------------------------------------
+model_resolver = get_model_resolver() # Started first so model discovery runs while the PDF is processed
 bm25_retriever, all_nodes = setup_rag_components() # Get all_nodes for 'Show All Chunks'
-gemini_model = get_gemini_model()
+st.sidebar.write(f"Gemini model: `{model_resolver.cached_model() or 'resolving...'}`")
+context_packer = ContextPacker(token_budget=CONTEXT_TOKEN_BUDGET)
 
 # Ensure components are ready before proceeding
-if bm25_retriever is None or gemini_model is None:
-    st.warning("RAG components or Gemini model failed to initialize. Please check logs above.")
+if bm25_retriever is None:
+    st.warning("RAG components failed to initialize. Please check logs above.")
     st.stop() # Stop execution if setup failed
 
 # -----------------------------------------------------
@@ -167,12 +162,16 @@ if st.button("Get Answer", use_container_width=True):
                 if not retrieved_nodes:
                     st.warning("I couldn't find relevant information in the document for your question. Please try rephrasing or asking something else related to the NCERT textbook.")
                 else:
-                    context = "\n\n".join([n.get_content() for n in retrieved_nodes])
-                    prompt = f"Context:\n{context}\n\nQuestion: {user_question}\nAnswer:"
+                    # Only the sentences that best match the question, within the token budget
+                    packed = context_packer.pack(user_question, retrieved_nodes)
+                    prompt = f"Context:\n{packed.text}\n\nQuestion: {user_question}\nAnswer:"
 
+                    gemini_model = get_gemini_model(model_resolver)
                     response = gemini_model.generate_content(prompt)
                     st.subheader("Answer:")
                     st.success(response.text)
+                    st.caption(f"Context: {packed.tokens_out} tokens sent, {packed.tokens_saved} saved "
+                               f"({packed.sentences_kept} of {packed.sentences_total} sentences kept)")
 
                     # Store for "Show Retrieved Context"
                     st.session_state['last_retrieved_nodes'] = retrieved_nodes
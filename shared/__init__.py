@@ -0,0 +1,7 @@
+"""
+Modules shared by the repo's Gemini chatbots.
+
+The apps under NirvanBhagabati/ and Team_MemManage/ are run from their own
+directories (`streamlit run ...`), so each one puts the repo root on sys.path
+before importing from here.
+"""
@@ -0,0 +1,160 @@
+"""
+Cached Gemini model discovery.
+
+The chatbots pick their Gemini model from a fixed priority list, but finding
+out which of those models the API key can use means walking the whole
+genai.list_models() catalogue, a network round trip on every cold start.
+GeminiModelResolver remembers the choice in a small JSON file:
+
+- A cached choice younger than the TTL is used without any network call.
+- An older one is still used right away while discovery refreshes it in a
+  background thread; if discovery fails, the cached choice stays.
+- With nothing cached, discovery starts in the background as soon as the
+  resolver starts, so the page renders while it runs; only a question
+  asked before it finishes waits for it.
+
+The cache is keyed by a fingerprint of the API key and by the priority list,
+so a different key or list never reuses another's choice.
+
+genai.configure() must be called before the resolver starts.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_MODELS = [
+    "models/gemini-1.5-flash-latest",
+    "models/gemini-1.5-flash",
+    "models/gemini-1.5-pro-latest",
+    "models/gemini-1.5-pro",
+    "models/gemini-pro"
+]
+
+
+def discover_model(priority=PRIORITY_MODELS):
+    """
+    Return the first model of `priority` that the configured API key can use for text generation.
+    """
+    available_gemini_models = set()
+    for m in genai.list_models():
+        if "generateContent" in m.supported_generation_methods:
+            if "gemini" in m.name.lower() and "vision" not in m.name.lower():
+                available_gemini_models.add(m.name)
+    for p_model in priority:
+        if p_model in available_gemini_models:
+            return p_model
+    raise LookupError("No suitable text-only Gemini model found. Please check your API key and model access.")
+
+
+class GeminiModelResolver:
+    """
+    Resolves the Gemini model name once and caches it on disk.
+
+    Args:
+        api_key (str): Key the choice is cached for (only a fingerprint is stored)
+        cache_path (str): JSON file holding the resolved model
+        ttl (float): Seconds before a cached choice is refreshed
+        priority (list): Model names in order of preference
+        retry_after (float): Seconds to wait after a failed discovery before trying again
+    """
+
+    def __init__(self, api_key, cache_path="gemini_model_cache.json", ttl=24 * 3600, priority=PRIORITY_MODELS,
+                 retry_after=60):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.priority = list(priority)
+        self._key = hashlib.sha256(f"{api_key}|{'|'.join(self.priority)}".encode("utf-8")).hexdigest()[:16]
+        self._cached = self._read_cache()
+        self._error = None
+        self._failed_at = None
+        self._done = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry = cache.get(self._key)
+        return entry if isinstance(entry, dict) and "model" in entry else None
+
+    def _write_cache(self, entry):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache[self._key] = entry
+        # Write a temporary file and swap it in, so a crash never leaves half a cache
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def _is_fresh(self, entry):
+        return time.time() - entry["resolved_at"] < self.ttl
+
+    def start(self):
+        """
+        Start discovery in the background unless a fresh choice is cached or discovery is running.
+        """
+        cached = self._cached
+        if cached is not None and self._is_fresh(cached):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # Keep a cached choice through an outage instead of retrying on every question
+            if cached is not None and self._failed_at is not None and time.time() - self._failed_at < self.retry_after:
+                return
+            self._done.clear()
+            self._thread = threading.Thread(target=self._discover, daemon=True)
+            self._thread.start()
+
+    def _discover(self):
+        try:
+            entry = {"model": discover_model(self.priority), "resolved_at": time.time()}
+            self._cached = entry
+            self._error = None
+            self._failed_at = None
+            self._write_cache(entry)
+        except Exception as e:
+            self._error = e
+            self._failed_at = time.time()
+            logger.warning("Gemini model discovery failed: %s", e)
+        finally:
+            self._done.set()
+
+    def cached_model(self):
+        """
+        Return the model chosen so far, or None while the first discovery is running.
+        """
+        cached = self._cached
+        return cached["model"] if cached is not None else None
+
+    def model_name(self, timeout=30):
+        """
+        Return the model to use, waiting up to `timeout` seconds only if nothing is cached yet.
+        """
+        cached = self._cached
+        if cached is not None:
+            if not self._is_fresh(cached):
+                self.start()
+            return cached["model"]
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Gemini model discovery did not finish within {timeout}s")
+        if self._cached is not None:
+            return self._cached["model"]
+        raise self._error
@@ -1,6 +1,7 @@
 import os  
 import streamlit as st  
 import requests  
+from requests.adapters import HTTPAdapter
 
 # Backend URL where FastAPI is running (update as needed)
 backend_url = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
@@ -12,6 +13,30 @@ st.set_page_config(
     page_icon="📄",
 )
 
+@st.cache_resource
+def get_http_adapter():
+    """
+    One connection pool shared by every browser session, so requests reuse
+    keep-alive connections to the backend instead of opening new ones.
+    urllib3's pool is thread-safe; requests.Session (cookies, headers) is not.
+    """
+    return HTTPAdapter(pool_connections=4, pool_maxsize=16)
+
+def get_http_session():
+    """
+    A requests.Session per browser session, kept across its reruns and
+    mounted on the shared connection pool.
+    """
+    if "http_session" not in st.session_state:
+        session = requests.Session()
+        adapter = get_http_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        st.session_state["http_session"] = session
+    return st.session_state["http_session"]
+
+http = get_http_session()
+
 # Main app header
 st.title("📄 Document Q&A (Streamlit + FastAPI + Gemini)")
 
@@ -30,7 +55,7 @@ def index_pdf(file):
     Returns the response object.
     """
     files = {"file": (file.name, file, "application/pdf")}
-    return requests.post(
+    return http.post(
         f"{backend_url}/upload-pdf",
         files=files,
         timeout=120,  # allow longer for indexing
@@ -52,27 +77,32 @@ st.header("2) Ask a Question")
 query = st.text_input("Enter your question about the PDF:")
 
 # Send query when button clicked
-def ask_question(text):
+def stream_answer(text):
     """
-    Send the user's question to /ask endpoint and return JSON.
+    Send the user's question to /ask-stream and yield the answer chunks as they arrive.
+    The read timeout applies between chunks, so a long answer never times out
+    while tokens keep coming.
     """
     data = {"question": text}
-    return requests.post(
-        f"{backend_url}/ask",
+    with http.post(
+        f"{backend_url}/ask-stream",
         data=data,
-        timeout=30,
-    )
+        stream=True,
+        timeout=(5, 60),  # (connect, wait for the next chunk)
+    ) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                yield chunk
 
 if query:
     if st.button("Get Answer"):
-        with st.spinner("Fetching answer..."):
-            try:
-                resp = ask_question(query)
-                resp.raise_for_status()
-                answer = resp.json().get("answer", "(no answer)")
-                st.markdown(f"**Answer:** {answer}")
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error fetching answer: {e}")
+        st.markdown("**Answer:**")
+        try:
+            # Render tokens as they arrive instead of waiting for the full answer
+            st.write_stream(stream_answer(query))
+        except requests.exceptions.RequestException as e:
+            st.error(f"Error fetching answer: {e}")
 
 # When no PDF uploaded yet, show info
 if not uploaded_file:
@@ -0,0 +1,255 @@
+"""
+Benchmark LLM backends on the WorthYourBuck retrieval-plus-synthesis pipeline.
+
+A fixed question set is replayed against each configured LLM backend (see
+model_backends.py) on a query engine built by main.py's own factories
+(pipeline.py): the same chunking, BM25 retrieval and compact synthesis. Each backend runs in a fresh process so that its peak
+memory is measured on its own. For every backend the report records:
+
+    time to first token      p50 / p95 / p99
+    total latency            p50 / p95 / p99
+    tokens per second        generated tokens / time after the first token
+    peak RSS                 of the benchmark process, model loaded
+    answer length            in characters and tokens
+
+Results are written as JSON (every run) and CSV (one summary row per backend).
+The "stub" backend needs no model or network, so CI can exercise the harness:
+
+    python benchmark.py --backends stub
+    python benchmark.py --backends gemini,llamacpp --repeats 3
+    python benchmark.py --pdf book.pdf --questions my_questions.txt
+
+Backend settings come from the same environment variables as main.py
+(GOOGLE_API_KEY, LLAMACPP_MODEL_PATH, LLAMACPP_THREADS, ...).
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from model_backends import LLM_BACKENDS, llm_options_from_env, make_llm
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PDF = os.path.join(HERE, "..", "NirvanBhagabati", "1-Week1CommonTask", "ncert.pdf")
+DEFAULT_QUESTIONS = os.path.join(HERE, "benchmark_questions.txt")
+
+SUMMARY_FIELDS = [
+    "backend", "runs", "errors", "load_s",
+    "ttft_p50_s", "ttft_p95_s", "ttft_p99_s",
+    "latency_p50_s", "latency_p95_s", "latency_p99_s",
+    "tokens_per_s_mean", "peak_rss_mb",
+    "answer_chars_mean", "answer_tokens_mean",
+]
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def build_engine(pdf_paths, llm):
+    """
+    Index the PDFs and build a streaming query engine exactly as main.py does.
+    """
+    from pipeline import build_bm25_retriever, build_query_engine, load_pdf_nodes
+
+    return build_query_engine(build_bm25_retriever(load_pdf_nodes(pdf_paths)), llm=llm, streaming=True)
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_question(engine, tokenizer, question):
+    """
+    Answer one question with streaming synthesis and time it.
+    """
+    from llama_index.core.schema import QueryBundle
+
+    start = time.perf_counter()
+    try:
+        query = QueryBundle(question)
+        nodes = engine.retrieve(query)
+        retrieved = time.perf_counter()
+        response = engine.synthesize(query, nodes)
+        first_token = None
+        parts = []
+        # Without any retrieved nodes the synthesizer answers without streaming
+        for token in getattr(response, "response_gen", None) or [str(response)]:
+            if first_token is None:
+                first_token = time.perf_counter()
+            parts.append(token)
+        end = time.perf_counter()
+    except Exception as e:
+        return {"question": question, "error": str(e)}
+
+    answer = "".join(parts)
+    answer_tokens = len(tokenizer(answer))
+    first_token = first_token or end
+    return {
+        "question": question,
+        "retrieval_s": retrieved - start,
+        "ttft_s": first_token - start,
+        "latency_s": end - start,
+        "answer_chars": len(answer),
+        "answer_tokens": answer_tokens,
+        "tokens_per_s": answer_tokens / (end - first_token) if end > first_token else None,
+        "answer": answer,
+    }
+
+
+def run_backend(backend, pdf_paths, questions, repeats, warmup):
+    """
+    Benchmark one backend; runs in its own process.
+    """
+    from llama_index.core.utils import get_tokenizer
+
+    start = time.perf_counter()
+    llm = make_llm(backend, **llm_options_from_env(backend))
+    load_s = time.perf_counter() - start
+
+    engine = build_engine(pdf_paths, llm)
+    tokenizer = get_tokenizer()
+
+    # Warm-up answers are not recorded (lazy model init, caches, connection setup)
+    for question in questions[:warmup]:
+        run_question(engine, tokenizer, question)
+
+    runs = []
+    for repeat in range(repeats):
+        for question in questions:
+            run = run_question(engine, tokenizer, question)
+            run["repeat"] = repeat
+            runs.append(run)
+    return {"backend": backend, "load_s": load_s, "peak_rss_bytes": peak_rss_bytes(), "runs": runs}
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def mean(values):
+    return float(np.mean(values)) if values else None
+
+
+def summarize(result):
+    """
+    Reduce one backend's runs to a summary row.
+    """
+    runs = result.get("runs", [])
+    ok = [run for run in runs if "error" not in run]
+    ttft = [run["ttft_s"] for run in ok]
+    latency = [run["latency_s"] for run in ok]
+    rss = result.get("peak_rss_bytes")
+    return {
+        "backend": result["backend"],
+        "runs": len(runs),
+        "errors": len(runs) - len(ok) + (1 if "error" in result else 0),
+        "load_s": result.get("load_s"),
+        "ttft_p50_s": percentile(ttft, 50),
+        "ttft_p95_s": percentile(ttft, 95),
+        "ttft_p99_s": percentile(ttft, 99),
+        "latency_p50_s": percentile(latency, 50),
+        "latency_p95_s": percentile(latency, 95),
+        "latency_p99_s": percentile(latency, 99),
+        "tokens_per_s_mean": mean([run["tokens_per_s"] for run in ok if run["tokens_per_s"] is not None]),
+        "peak_rss_mb": rss / (1024 * 1024) if rss else None,
+        "answer_chars_mean": mean([run["answer_chars"] for run in ok]),
+        "answer_tokens_mean": mean([run["answer_tokens"] for run in ok]),
+    }
+
+
+def write_reports(report, out_dir):
+    """
+    Write the full report as JSON and the per-backend summaries as CSV.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(report["started_at"]))
+    json_path = os.path.join(out_dir, f"benchmark-{stamp}.json")
+    csv_path = os.path.join(out_dir, f"benchmark-{stamp}.csv")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for result in report["results"]:
+            writer.writerow(result["summary"])
+    return json_path, csv_path
+
+
+def format_cell(value):
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LLM backends on the WorthYourBuck pipeline.")
+    parser.add_argument("--backends", default="stub",
+                        help=f"Comma-separated backends to compare ({', '.join(LLM_BACKENDS)})")
+    parser.add_argument("--pdf", action="append", help="PDF to index; repeat for several (default: NCERT sample)")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="File with one question per line")
+    parser.add_argument("--repeats", type=int, default=1, help="Times the question set is replayed")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded questions asked first")
+    parser.add_argument("--out-dir", default="benchmark_results", help="Directory for the JSON and CSV reports")
+    args = parser.parse_args(argv)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in LLM_BACKENDS]
+    if unknown:
+        parser.error(f"unknown backend(s): {', '.join(unknown)}")
+    pdf_paths = [os.path.abspath(p) for p in (args.pdf or [DEFAULT_PDF])]
+    questions = load_questions(args.questions)
+
+    report = {
+        "started_at": time.time(),
+        "pdfs": pdf_paths,
+        "questions": len(questions),
+        "repeats": args.repeats,
+        "warmup": args.warmup,
+        "results": [],
+    }
+    # A fresh process per backend keeps one model's memory out of the next one's peak RSS
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        print(f"Benchmarking {backend} ...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            future = pool.submit(run_backend, backend, pdf_paths, questions, args.repeats, args.warmup)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"backend": backend, "error": str(e), "runs": []}
+        result["summary"] = summarize(result)
+        report["results"].append(result)
+
+    json_path, csv_path = write_reports(report, args.out_dir)
+
+    columns = ["backend", "errors", "ttft_p50_s", "latency_p50_s", "latency_p95_s",
+               "latency_p99_s", "tokens_per_s_mean", "peak_rss_mb", "answer_tokens_mean"]
+    print("\t".join(columns))
+    for result in report["results"]:
+        print("\t".join(format_cell(result["summary"][c]) for c in columns))
+        if "error" in result:
+            print(f"  {result['backend']} failed: {result['error']}")
+    print(f"Reports: {json_path}, {csv_path}")
+    return 0 if all(r["summary"]["errors"] == 0 for r in report["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
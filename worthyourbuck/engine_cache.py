@@ -0,0 +1,136 @@
+"""
+Process-wide, memory-bounded cache of the collections currently in use.
+
+Each named collection holds a vector index and a BM25 query engine over all
+of its PDFs. Loading one from its snapshot under INDEX_PERSIST_DIR costs
+disk reads and BM25 re-tokenization, so loaded collections are kept in
+memory under their collection id and reused for every following question.
+When the cache outgrows its budget, the least recently used collections are
+dropped and reloaded from their snapshots when asked about again.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+def estimate_bm25_bytes(retriever):
+    """
+    Estimates how much memory a BM25Retriever holds on to.
+
+    Args:
+        retriever (BM25Retriever): The retriever to measure
+
+    Returns:
+        int: Approximate size in bytes
+
+    How it works:
+    - Counts the text and metadata of every stored chunk in the corpus
+    - Adds the size of the numpy arrays backing the BM25 score matrix
+    """
+    size = 0
+    for node_dict in retriever.corpus or []:
+        for value in node_dict.values():
+            size += len(str(value))
+    scores = getattr(retriever.bm25, 'scores', None) or {}
+    for array in scores.values():
+        size += getattr(array, 'nbytes', 0)
+    return size
+
+
+class EngineCache:
+    """
+    Thread-safe LRU cache of collections bounded by an approximate memory budget.
+
+    Each entry is stored with its estimated size in bytes. When adding an entry
+    pushes the total over `max_bytes`, the least recently used collections are
+    evicted until the cache fits again. A collection larger than the whole
+    budget is still returned to the caller but never stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # collection id -> (collection, size_bytes)
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """
+        Returns the cached collection for `key` and marks it as recently used, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, engine, size_bytes):
+        """
+        Stores a collection, evicting least recently used entries to stay within budget.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if size_bytes > self.max_bytes:
+                return
+            self._entries[key] = (engine, size_bytes)
+            self.total_bytes += size_bytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def discard(self, key):
+        """
+        Drops the collection cached for `key`, if any.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+    def get_or_build(self, key, builder):
+        """
+        Returns the cached collection for `key`, loading it on a miss.
+
+        Args:
+            key (str): Collection id
+            builder (callable): Called with no arguments on a miss; must return
+                a tuple of (collection, size_bytes)
+
+        Returns:
+            The cached or freshly loaded collection
+
+        How it works:
+        - A per-key lock makes concurrent requests for the same collection wait
+          for a single load instead of reading its snapshot several times
+        - Requests for other collections are not blocked while a load runs
+        """
+        engine = self.get(key)
+        if engine is not None:
+            return engine
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            engine = self.get(key)
+            if engine is None:
+                engine, size_bytes = builder()
+                self.put(key, engine, size_bytes)
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return engine
+
+    def clear(self):
+        """
+        Drops every cached collection.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
@@ -1,93 +1,645 @@
 import os
+import re
+import json
 import shutil
+import tempfile
+import hashlib
+import asyncio
+import time
+from typing import List
 from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
 
 # Load Google API key from environment variables
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-# LlamaIndex imports for embeddings, indexing, and querying
-from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from llama_index.core import Settings, VectorStoreIndex, SimpleDirectoryReader
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.llms.google_genai import GoogleGenAI
-from llama_index.core import get_response_synthesizer
+# LlamaIndex imports for indexing and querying
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core import StorageContext, load_index_from_storage
 from llama_index.retrievers.bm25 import BM25Retriever
-from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+import bm25s
+
+# Disk cache so each chunk is embedded at most once per model
+from embedding_cache import CachedEmbedding
+# LLM and embedding backends selected by configuration (Gemini or local CPU models)
+from model_backends import llm_options_from_env, make_embed_model, make_llm
+# Quotes the top BM25 chunk instead of calling the LLM when the hit is unambiguous
+from extractive import ExtractiveAnswerer
+# Memory-bounded LRU holding the collections currently in use
+from engine_cache import EngineCache, estimate_bm25_bytes
+# Chunking, BM25 and query engine factories, shared with benchmark.py and calibrate_extractive.py
+from pipeline import build_bm25_retriever, build_query_engine, build_synthesizer, load_bm25_retriever, load_pdf_nodes
 
 # Initialize FastAPI app
 app = FastAPI()
 
-# Directory where uploaded PDFs will be stored
+# Directory where uploaded PDFs will be stored, one sub-directory per collection
 pdf_dir = "./uploaded_pdf"
 os.makedirs(pdf_dir, exist_ok=True)
 
-# Globals to hold the index and query engine instances
-document_index = None
-query_engine = None
+# Model backends: "gemini" (default) or local CPU models for offline deployments
+llm_backend = os.getenv("LLM_BACKEND", "gemini")
+embed_backend = os.getenv("EMBED_BACKEND", "gemini")
+# Backend settings (LLAMACPP_MODEL_PATH, LLAMACPP_THREADS, ...) are read by model_backends
+# Hugging Face model id or local directory for EMBED_BACKEND=huggingface
+hf_embed_model = os.getenv("HF_EMBED_MODEL", "BAAI/bge-small-en-v1.5")
 
-@app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...)):
+# Directory holding cached chunk embeddings (float16 vectors keyed by text hash)
+embedding_cache_dir = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+
+# Directory the indexes (docstore, vector store, BM25 state) are persisted to,
+# one sub-directory per collection, so restarts and new workers reload them
+# instead of re-embedding every PDF. Every save writes a new numbered snapshot
+# (v1, v2, ...) and then points current.json at it.
+index_persist_dir = os.getenv("INDEX_PERSIST_DIR", "./index_storage")
+BM25_SUBDIR = "bm25"
+INGESTED_FILE = "ingested.json"
+# Written last, so it only ever names a complete snapshot
+CURRENT_FILE = "current.json"
+# How often a save or load is retried when another worker saves at the same time
+SNAPSHOT_RETRIES = 3
+
+# Named collections keep each class's PDFs apart; requests without one use the default
+DEFAULT_COLLECTION = "default"
+COLLECTION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Collections in use stay in memory up to this budget; least recently used ones
+# are evicted and reloaded from index_persist_dir when asked about again
+collection_cache_max_mb = int(os.getenv("COLLECTION_CACHE_MAX_MB", "1024"))
+collections = EngineCache(max_bytes=collection_cache_max_mb * 1024 * 1024)
+
+models_configured = False
+
+# Backpressure for /ask: at most ask_max_concurrency questions are answered at once
+# and at most ask_max_waiting wait for a slot; beyond that /ask answers 503
+ask_max_concurrency = int(os.getenv("ASK_MAX_CONCURRENCY", "8"))
+ask_max_waiting = int(os.getenv("ASK_MAX_WAITING", "32"))
+ask_slots = asyncio.Semaphore(ask_max_concurrency)
+ask_waiting = 0
+
+# Largest worksheet accepted by /ask-batch in one request
+ask_batch_max_questions = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "50"))
+
+# Set EXTRACTIVE_MODE=1 to answer high-confidence BM25 hits by quoting the top chunk,
+# skipping the LLM; thresholds are corpus-dependent, calibrate them with calibrate_extractive.py
+extractive_answerer = None
+if os.getenv("EXTRACTIVE_MODE", "0") == "1":
+    extractive_answerer = ExtractiveAnswerer(
+        min_score=float(os.getenv("EXTRACTIVE_MIN_SCORE", "2.8")),
+        min_margin=float(os.getenv("EXTRACTIVE_MIN_MARGIN", "0.2")),
+        max_sentences=int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "2"))
+    )
+
+def configure_models():
     """
-    Save an uploaded PDF locally and build a searchable index
-    using Google GenAI embeddings and BM25 retrieval.
+    Create the configured embedding model and LLM once and register them in Settings.
+    """
+    global models_configured
+    if models_configured:
+        return
+    Settings.embed_model = CachedEmbedding.wrap(
+        make_embed_model(
+            embed_backend,
+            api_key=GOOGLE_API_KEY,
+            model_name=hf_embed_model
+        ),
+        cache_dir=embedding_cache_dir
+    )
+    Settings.llm = make_llm(llm_backend, **llm_options_from_env(llm_backend))
+    models_configured = True
+
+def build_collection_engine(index, bm25=None):
+    """
+    Build a BM25 query engine over every node stored in the index.
+    Pass a restored `bm25` retriever to skip rebuilding it.
+    """
+    # BM25 statistics cannot be extended in place, so the retriever is rebuilt
+    # from the stored nodes; this only re-tokenizes text, nothing is re-parsed or re-embedded
+    if bm25 is None:
+        bm25 = build_bm25_retriever(list(index.docstore.docs.values()))
+    return build_query_engine(bm25)
+
+class Collection:
+    """
+    The index, query engine and ingested PDF hashes of one named collection.
+    """
+
+    def __init__(self, name, index=None, query_engine=None, ingested_hashes=None):
+        self.name = name
+        self.index = index
+        self.query_engine = query_engine
+        # SHA-256 of every PDF already in the index -> the filename it was uploaded as
+        self.ingested_hashes = ingested_hashes or {}
+        # Snapshot this copy was loaded from or last saved as; 0 means never saved
+        self.version = 0
+
+    def estimate_bytes(self):
+        """
+        Approximate memory held by the collection: chunk text, BM25 scores and vectors.
+        """
+        if self.query_engine is None:
+            return 0
+        size = estimate_bm25_bytes(self.query_engine.retriever)
+        data = getattr(self.index.vector_store, "data", None)
+        for vector in getattr(data, "embedding_dict", {}).values():
+            # A Python list of floats costs roughly 32 bytes per element
+            size += 32 * len(vector)
+        return size
+
+class SnapshotConflict(Exception):
+    """
+    Another worker saved a newer snapshot of the collection than the one being changed.
+    """
+
+def collection_root(name):
+    return os.path.join(index_persist_dir, name)
+
+def snapshot_dir(name, version):
+    return os.path.join(collection_root(name), f"v{version}")
+
+def read_snapshot_version(name):
+    """
+    Return the version of the collection's current snapshot, or 0 if it has none.
+    """
+    try:
+        with open(os.path.join(collection_root(name), CURRENT_FILE)) as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+def persist_collection(collection):
+    """
+    Save a collection's index, BM25 state and ingested hashes as its next snapshot version.
+    The snapshot is written to a temporary directory and renamed into place before
+    current.json is switched to it, so a worker loading the collection always finds
+    a complete snapshot. Raises SnapshotConflict, saving nothing, if another worker
+    saved a newer snapshot since this copy was loaded.
+    """
+    name = collection.name
+    root = os.path.abspath(collection_root(name))
+    os.makedirs(root, exist_ok=True)
+    if read_snapshot_version(name) != collection.version:
+        raise SnapshotConflict(name)
+    version = collection.version + 1
+    target = os.path.abspath(snapshot_dir(name, version))
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp.", dir=root)
+    try:
+        collection.index.storage_context.persist(persist_dir=tmp_dir)
+        collection.query_engine.retriever.persist(os.path.join(tmp_dir, BM25_SUBDIR))
+        with open(os.path.join(tmp_dir, INGESTED_FILE), "w") as f:
+            json.dump(collection.ingested_hashes, f)
+        # Renaming onto an existing snapshot fails, so of two workers saving the same version only one wins
+        os.rename(tmp_dir, target)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if os.path.exists(target):
+            raise SnapshotConflict(name)
+        raise
+
+    current_tmp = os.path.join(root, f".{CURRENT_FILE}.{version}.tmp")
+    with open(current_tmp, "w") as f:
+        json.dump({"version": version}, f)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    collection.version = version
+
+    # Keep the previous snapshot for workers still loading it; older ones can go
+    for entry in os.listdir(root):
+        if entry.startswith("v") and entry[1:].isdigit() and int(entry[1:]) < version - 1:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+def collection_is_persisted(name):
+    return read_snapshot_version(name) > 0
+
+def load_collection(name):
+    """
+    Load a collection from its current snapshot, or start an empty one if it has none.
+    Returns (collection, estimated size in bytes) as EngineCache expects.
+    """
+    collection = Collection(name)
+    version = read_snapshot_version(name)
+    for attempt in range(SNAPSHOT_RETRIES):
+        if version == 0:
+            break
+        try:
+            configure_models()
+            persist_dir = snapshot_dir(name, version)
+            storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+            collection.index = load_index_from_storage(storage_context)
+            bm25 = load_bm25_retriever(os.path.join(persist_dir, BM25_SUBDIR))
+            collection.query_engine = build_collection_engine(collection.index, bm25)
+            with open(os.path.join(persist_dir, INGESTED_FILE)) as f:
+                collection.ingested_hashes = json.load(f)
+            collection.version = version
+            break
+        except FileNotFoundError:
+            # Newer saves removed the snapshot while it was being read; load the current one instead
+            if attempt == SNAPSHOT_RETRIES - 1:
+                raise
+            version = read_snapshot_version(name)
+    return collection, collection.estimate_bytes()
+
+async def get_collection(name):
+    """
+    Return a collection from the in-memory LRU, loading it off the event loop on a miss
+    or when another worker has saved a newer snapshot.
+    Concurrent requests for the same collection wait for a single load.
+    """
+    collection = collections.get(name)
+    if collection is not None and read_snapshot_version(name) > collection.version:
+        # Another worker saved PDFs since this copy was loaded
+        collections.discard(name)
+        collection = None
+    if collection is None:
+        collection = await asyncio.to_thread(collections.get_or_build, name, lambda: load_collection(name))
+    return collection
+
+def invalid_collection_response():
+    return JSONResponse(
+        status_code=400,
+        content={"error": "Collection ids may only contain letters, digits, '_' and '-' (max 64)."}
+    )
+
+def missing_collection_response(name):
+    return JSONResponse(
+        status_code=400,
+        content={"error": f"No PDF indexed in collection '{name}'. Upload first."}
+    )
+
+async def get_answerable_collection(name):
+    """
+    Return the collection for a question, or an error response if it cannot be asked.
+    """
+    if not COLLECTION_ID_PATTERN.match(name):
+        return None, invalid_collection_response()
+    # Don't create cache entries for collections that were never uploaded to
+    if name not in collections and not collection_is_persisted(name):
+        return None, missing_collection_response(name)
+    collection = await get_collection(name)
+    if collection.query_engine is None:
+        return None, missing_collection_response(name)
+    return collection, None
+
+@app.on_event("startup")
+async def warm_default_collection():
+    # Load the default collection in the background so early questions don't pay for it
+    if collection_is_persisted(DEFAULT_COLLECTION):
+        asyncio.create_task(get_collection(DEFAULT_COLLECTION))
+
+# One lock per collection: uploads to the same collection are applied one at a time
+upload_locks = {}
+
+def remove_file_nodes(coll, filename):
+    """
+    Delete the chunks of a previously uploaded version of `filename` from the
+    collection's docstore and vector store, and forget its hash.
+    Returns the number of chunks removed.
+    """
+    file_name = os.path.basename(filename)
+    # Filename -> hash of the version currently indexed under that name
+    file_hashes = {os.path.basename(name): sha for sha, name in coll.ingested_hashes.items()}
+    old_hash = file_hashes.get(file_name)
+    if old_hash is None or coll.index is None:
+        return 0
+    node_ids = [
+        node_id for node_id, node in coll.index.docstore.docs.items()
+        if node.metadata.get("file_name") == file_name
+    ]
+    if node_ids:
+        coll.index.delete_nodes(node_ids, delete_from_docstore=True)
+    del coll.ingested_hashes[old_hash]
+    return len(node_ids)
+
+def add_pdf(coll, content, content_hash, filename):
+    """
+    Save a PDF, parse and embed only its chunks, and add them to the collection's index.
+    A PDF uploaded again under the same filename with new content replaces the
+    old version's chunks instead of being indexed next to them.
+    Blocking (parsing, embedding, persisting), so it runs in a worker thread.
+    If another worker saves the collection meanwhile, the chunks are added to its
+    snapshot instead of overwriting it. Returns the number of chunks added.
     """
     # Store the incoming PDF to disk
-    file_path = os.path.join(pdf_dir, file.filename)
+    collection_pdf_dir = os.path.join(pdf_dir, coll.name)
+    os.makedirs(collection_pdf_dir, exist_ok=True)
+    file_path = os.path.join(collection_pdf_dir, os.path.basename(filename))
     with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        buffer.write(content)
 
-    # Set up the embedding model for later use
-    embed_model = GoogleGenAIEmbedding(
-        model_name="models/embedding-001",
-        api_key=GOOGLE_API_KEY
-    )
-    Settings.embed_model = embed_model
+    configure_models()
+
+    # Read only the new PDF, split into chunks, and create nodes
+    nodes = load_pdf_nodes([file_path])
+
+    try:
+        for attempt in range(SNAPSHOT_RETRIES):
+            # Build on the newest snapshot, never over it
+            if read_snapshot_version(coll.name) != coll.version:
+                coll, _ = load_collection(coll.name)
+                if content_hash in coll.ingested_hashes:
+                    # Another worker indexed the same PDF meanwhile
+                    collections.put(coll.name, coll, coll.estimate_bytes())
+                    return 0
+
+            # The file on disk was just overwritten; drop the chunks of its previous version
+            remove_file_nodes(coll, filename)
+
+            # Embed just the new nodes and add them to the collection's vector store index
+            if coll.index is None:
+                coll.index = VectorStoreIndex(nodes)
+            else:
+                coll.index.insert_nodes(nodes)
+
+            # Rebuilt from the docstore, so BM25 no longer sees the removed chunks either
+            coll.query_engine = build_collection_engine(coll.index)
+            coll.ingested_hashes[content_hash] = filename
+            try:
+                persist_collection(coll)
+                break
+            except SnapshotConflict:
+                if attempt == SNAPSHOT_RETRIES - 1:
+                    raise
+    except Exception:
+        # The cached copy may hold chunks that were never saved; reload it on next use
+        collections.discard(coll.name)
+        raise
+    # Re-insert with the grown size so the memory budget stays accurate
+    collections.put(coll.name, coll, coll.estimate_bytes())
+    return len(nodes)
+
+@app.post("/upload-pdf")
+async def upload_pdf(file: UploadFile = File(...), collection: str = Form(DEFAULT_COLLECTION)):
+    """
+    Save an uploaded PDF locally and add it to the collection's searchable index
+    using Google GenAI embeddings and BM25 retrieval.
+    Only the new file is parsed and embedded; identical re-uploads are skipped,
+    and changed content under an existing filename replaces the old version.
+    Ingestion runs in a worker thread, so questions keep being answered meanwhile.
+    """
+    if not COLLECTION_ID_PATTERN.match(collection):
+        return invalid_collection_response()
+    content = await file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    # Held across the duplicate check and the ingestion, so two uploads can't both add the same PDF
+    async with upload_locks.setdefault(collection, asyncio.Lock()):
+        coll = await get_collection(collection)
 
-    # Read all PDFs, split into chunks, and create nodes
-    docs = SimpleDirectoryReader(pdf_dir).load_data()
-    splitter = SentenceSplitter(chunk_size=750, chunk_overlap=150)
-    nodes = splitter.get_nodes_from_documents(docs)
+        # Skip content that is already indexed, whatever the file is called
+        if content_hash in coll.ingested_hashes:
+            return {
+                "message": "PDF already indexed, skipped.",
+                "collection": collection,
+                "duplicate_of": coll.ingested_hashes[content_hash]
+            }
 
-    # Build or overwrite the vector store index
-global document_index, query_engine
-    document_index = VectorStoreIndex(nodes)
+        nodes_added = await asyncio.to_thread(add_pdf, coll, content, content_hash, file.filename)
 
-    # Configure BM25 retriever on the new index
-    bm25 = BM25Retriever.from_defaults(
-        index=document_index,
-        similarity_top_k=3
+    return {
+        "message": "PDF uploaded and indexed successfully.",
+        "collection": collection,
+        "nodes_added": nodes_added
+    }
+
+TOO_BUSY_MESSAGE = "Too many questions in progress. Please retry shortly."
+
+def ask_queue_full():
+    return ask_slots.locked() and ask_waiting >= ask_max_waiting
+
+def too_busy_response():
+    return JSONResponse(
+        status_code=503,
+        content={"error": TOO_BUSY_MESSAGE},
+        headers={"Retry-After": "1"}
     )
 
-    # Initialize the LLM for answer generation
-    llm = GoogleGenAI(
-        model="gemini-2.0-flash",
-        api_key=GOOGLE_API_KEY
+async def acquire_ask_slot():
+    """
+    Wait for one of the ask_max_concurrency answering slots, counted in ask_waiting meanwhile.
+    """
+    global ask_waiting
+    ask_waiting += 1
+    try:
+        await ask_slots.acquire()
+    finally:
+        ask_waiting -= 1
+
+def extractive_result(question, hit):
+    """
+    Shape a fast-path answer like /ask's, plus the scores that admitted it and its source.
+    """
+    metadata = hit.node.node.metadata
+    return {
+        "question": question,
+        "answer": hit.answer,
+        "mode": "extractive",
+        "top_score": round(hit.top_score, 3),
+        "margin": round(hit.margin, 3),
+        "source": {"file_name": metadata.get("file_name"), "page": metadata.get("page_label")}
+    }
+
+@app.post("/ask")
+async def ask_question(question: str = Form(...), collection: str = Form(DEFAULT_COLLECTION)):
+    """
+    Answer a user question based on the PDFs indexed in a collection.
+    BM25 retrieval is synchronous and CPU-bound, so it runs in a worker thread;
+    only the LLM call is awaited on the event loop.
+    With EXTRACTIVE_MODE on, unambiguous BM25 hits are quoted without calling the LLM.
+    """
+    coll, error = await get_answerable_collection(collection)
+    if error:
+        return error
+
+    nodes = await asyncio.to_thread(coll.query_engine.retrieve, question)
+    # The fast path needs no LLM slot, so it runs before the backpressure check
+    if extractive_answerer:
+        hit = extractive_answerer.answer(question, nodes)
+        if hit:
+            return extractive_result(question, hit)
+
+    # Shed load instead of queueing without bound
+    if ask_queue_full():
+        return too_busy_response()
+
+    await acquire_ask_slot()
+
+    # Synthesize from the nodes retrieved above and return the result
+    try:
+        resp = await coll.query_engine.asynthesize(QueryBundle(question), nodes)
+    finally:
+        ask_slots.release()
+    answer = getattr(resp, "response", str(resp))
+    return {"question": question, "answer": answer, "mode": "synthesized"}
+
+@app.post("/ask-stream")
+async def ask_question_stream(question: str = Form(...), collection: str = Form(DEFAULT_COLLECTION)):
+    """
+    Like /ask, but streams the answer as plain-text chunks while the LLM generates it.
+    The X-Answer-Mode header says whether the answer is extractive or synthesized.
+    """
+    coll, error = await get_answerable_collection(collection)
+    if error:
+        return error
+
+    engine = coll.query_engine
+    # Off the event loop, like /ask
+    nodes = await asyncio.to_thread(engine.retrieve, question)
+    if extractive_answerer:
+        hit = extractive_answerer.answer(question, nodes)
+        if hit:
+            return StreamingResponse(
+                iter([hit.answer]),
+                media_type="text/plain; charset=utf-8",
+                headers={"X-Answer-Mode": "extractive"}
+            )
+
+    if ask_queue_full():
+        return too_busy_response()
+
+    async def token_stream():
+        # The slot is taken here rather than before returning, so a client that
+        # disconnects before the body is read never holds one; it is held until
+        # the last token is sent (or the client goes away)
+        await acquire_ask_slot()
+        try:
+            synth = build_synthesizer(streaming=True)
+            resp = await synth.asynthesize(QueryBundle(question), nodes)
+            if hasattr(resp, "async_response_gen"):
+                async for token in resp.async_response_gen():
+                    yield token
+            else:
+                # Synthesizers that cannot stream return the whole answer at once
+                yield resp.response or ""
+        except Exception as e:
+            # Headers are already sent, so report the failure in the body
+            yield f"\n\n[Error: {e}]"
+        finally:
+            ask_slots.release()
+
+    return StreamingResponse(
+        token_stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "X-Answer-Mode": "synthesized",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # stop reverse proxies from buffering the stream
+        }
     )
-    Settings.llm = llm
 
-    # Combine retriever with a compact response synthesizer
-    synth = get_response_synthesizer(response_mode="compact")
-    query_engine = RetrieverQueryEngine(
-        retriever=bm25,
-        response_synthesizer=synth
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    collection: str = DEFAULT_COLLECTION
+
+def retrieve_batch(retriever, questions):
+    """
+    Run BM25 retrieval for many questions in one vectorized bm25s call.
+    Returns one list of NodeWithScore per question, in order.
+    """
+    tokens = bm25s.tokenize(
+        questions,
+        stemmer=retriever.stemmer if not retriever.skip_stemming else None,
+        token_pattern=retriever.token_pattern,
+        show_progress=False
+    )
+    indexes, scores = retriever.bm25.retrieve(
+        tokens, k=retriever.similarity_top_k, show_progress=False
     )
 
-    return {"message": "PDF uploaded and indexed successfully."}
+    results = []
+    for row_indexes, row_scores in zip(indexes, scores):
+        nodes = []
+        for idx, score in zip(row_indexes, row_scores):
+            # idx is a corpus position, or the node dict itself if bm25s holds the corpus
+            node_dict = idx if isinstance(idx, dict) else retriever.corpus[int(idx)]
+            nodes.append(NodeWithScore(node=metadata_dict_to_node(node_dict), score=float(score)))
+        results.append(nodes)
+    return results
 
-@app.post("/ask")
-async def ask_question(question: str = Form(...)):
+async def synthesize_one(engine, question, nodes):
     """
-    Answer a user question based on the indexed PDF content.
+    Synthesize one answer from already retrieved nodes, sharing /ask's concurrency slots
+    and waiting limit: a question that would overflow the queue is shed with an error.
+    """
+    queued_at = time.perf_counter()
+    if ask_queue_full():
+        return {
+            "question": question,
+            "error": TOO_BUSY_MESSAGE,
+            "timings": {"wait_ms": 0.0, "synthesis_ms": 0.0}
+        }
+    await acquire_ask_slot()
+    started_at = time.perf_counter()
+    try:
+        resp = await engine.asynthesize(QueryBundle(question), nodes)
+        result = {"question": question, "answer": getattr(resp, "response", str(resp)), "mode": "synthesized"}
+    except Exception as e:
+        result = {"question": question, "error": str(e)}
+    finally:
+        ask_slots.release()
+    result["timings"] = {
+        "wait_ms": round((started_at - queued_at) * 1000, 1),
+        "synthesis_ms": round((time.perf_counter() - started_at) * 1000, 1)
+    }
+    return result
+
+async def answer_one(engine, question, nodes):
+    """
+    Answer one batch question, by quoting the top hit when possible, otherwise by synthesis.
+    """
+    if extractive_answerer:
+        hit = extractive_answerer.answer(question, nodes)
+        if hit:
+            result = extractive_result(question, hit)
+            result["timings"] = {"wait_ms": 0.0, "synthesis_ms": 0.0}
+            return result
+    return await synthesize_one(engine, question, nodes)
+
+@app.post("/ask-batch")
+async def ask_batch(request: AskBatchRequest):
     """
-    global query_engine
-    if not query_engine:
+    Answer a whole worksheet of questions in one request.
+    BM25 retrieval runs once for all questions; synthesis fans out with the
+    same concurrency and waiting limits as /ask, and questions beyond them get
+    an error instead of an answer. Answers come back in question order.
+    """
+    coll, error = await get_answerable_collection(request.collection)
+    if error:
+        return error
+    engine = coll.query_engine
+    questions = request.questions
+    if not questions or len(questions) > ask_batch_max_questions:
         return JSONResponse(
-            status_code=400,
-            content={"error": "No PDF indexed. Upload first."}
+            status_code=422,
+            content={"error": f"Send between 1 and {ask_batch_max_questions} questions."}
         )
 
-    # Query the engine and return the result
-    resp = query_engine.query(question)
-    answer = getattr(resp, "response", str(resp))
-    return {"question": question, "answer": answer}
+    started_at = time.perf_counter()
+    retriever = engine.retriever
+    # BM25 is synchronous, so it runs in a worker thread to keep the event loop free
+    if isinstance(retriever, BM25Retriever):
+        retrieved = await asyncio.to_thread(retrieve_batch, retriever, questions)
+    else:
+        retrieved = await asyncio.gather(*[asyncio.to_thread(retriever.retrieve, q) for q in questions])
+    retrieval_ms = round((time.perf_counter() - started_at) * 1000, 1)
+
+    results = await asyncio.gather(*[
+        answer_one(engine, q, nodes) for q, nodes in zip(questions, retrieved)
+    ])
+    return {
+        "results": results,
+        "timings": {
+            "retrieval_ms": retrieval_ms,
+            "total_ms": round((time.perf_counter() - started_at) * 1000, 1)
+        }
+    }
+
+@app.get("/stats")
+async def stats():
+    """
+    Report how often the extractive fast path answered instead of the LLM.
+    """
+    if not extractive_answerer:
+        return {"extractive_mode": False}
+    return {"extractive_mode": True, **extractive_answerer.stats()}
@@ -0,0 +1,212 @@
+"""
+Pluggable model backends for the WorthYourBuck pipeline.
+
+The LLM used for answer synthesis and the embedding model used for indexing
+are chosen by configuration instead of being hardwired to Gemini:
+
+    LLM backends
+        gemini       Gemini 2.0 Flash through the Google GenAI API (default)
+        llamacpp     A quantized GGUF small language model run on the CPU with llama.cpp
+        stub         A deterministic offline fake, for tests and benchmark CI runs
+
+    Embedding backends
+        gemini       Google GenAI embedding-001 (default)
+        huggingface  A sentence-transformers model run locally
+
+With the llamacpp LLM, the huggingface embeddings, and both models already on
+disk (set HF_HUB_OFFLINE=1), the pipeline makes no network calls at all.
+The local backends are optional dependencies:
+
+    pip install llama-index-llms-llama-cpp llama-cpp-python
+    pip install llama-index-embeddings-huggingface
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any
+
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+LLM_BACKENDS = ("gemini", "llamacpp", "stub")
+EMBED_BACKENDS = ("gemini", "huggingface")
+
+# llama.cpp contexts are not thread-safe; generations on one process run one at a time
+_llamacpp_lock = threading.Lock()
+
+
+def make_gemini_llm(api_key, model="gemini-2.0-flash"):
+    from llama_index.llms.google_genai import GoogleGenAI
+    return GoogleGenAI(model=model, api_key=api_key)
+
+
+def make_llamacpp_llm(model_path, n_threads=None, context_window=4096, max_new_tokens=256, temperature=0.1):
+    """
+    Load a GGUF model for CPU inference with llama.cpp.
+
+    n_threads defaults to every core; context_window is the model's n_ctx and
+    must fit the compacted chunks plus the answer.
+    """
+    try:
+        from llama_index.llms.llama_cpp import LlamaCPP
+    except ImportError as e:
+        raise ImportError(
+            "LLM_BACKEND=llamacpp needs: pip install llama-index-llms-llama-cpp llama-cpp-python"
+        ) from e
+    if not model_path or not os.path.isfile(model_path):
+        # Never fall back to downloading a model: deployments are offline
+        raise ValueError(f"LLAMACPP_MODEL_PATH must point to a local .gguf file, got {model_path!r}")
+
+    class CPULlamaCPP(LlamaCPP):
+        # LlamaCPP's async methods run generation on the event loop; move it to a
+        # worker thread so the FastAPI app stays responsive during a slow answer
+        async def acomplete(self, prompt, formatted=False, **kwargs):
+            return await asyncio.to_thread(self.complete, prompt, formatted, **kwargs)
+
+        async def achat(self, messages, **kwargs):
+            return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+        def complete(self, prompt, formatted=False, **kwargs):
+            with _llamacpp_lock:
+                return super().complete(prompt, formatted, **kwargs)
+
+        def stream_complete(self, prompt, formatted=False, **kwargs):
+            parent = super()
+
+            def locked_stream():
+                with _llamacpp_lock:
+                    yield from parent.stream_complete(prompt, formatted, **kwargs)
+            return locked_stream()
+
+        async def astream_complete(self, prompt, formatted=False, **kwargs):
+            stream = self.stream_complete(prompt, formatted, **kwargs)
+
+            async def gen():
+                # Produce each token on a worker thread, never on the event loop
+                done = object()
+                try:
+                    while True:
+                        item = await asyncio.to_thread(next, stream, done)
+                        if item is done:
+                            break
+                        yield item
+                finally:
+                    stream.close()
+            return gen()
+
+    return CPULlamaCPP(
+        model_path=model_path,
+        temperature=temperature,
+        max_new_tokens=max_new_tokens,
+        context_window=context_window,
+        model_kwargs={
+            "n_threads": n_threads or os.cpu_count(),
+            "n_gpu_layers": 0,
+        },
+        verbose=False,
+    )
+
+
+class StubLLM(CustomLLM):
+    """
+    Deterministic LLM that needs no model and no network.
+
+    It "answers" with the first max_new_tokens words of the prompt, streamed
+    one word at a time with an optional delay, so the same question and
+    context always give the same answer.
+    """
+
+    max_new_tokens: int = 64
+    token_delay: float = 0.0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=4096, num_output=self.max_new_tokens, model_name="stub")
+
+    def _words(self, prompt):
+        return prompt.split()[:self.max_new_tokens]
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        words = self._words(prompt)
+        time.sleep(self.token_delay * len(words))
+        return CompletionResponse(text=" ".join(words))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        def gen():
+            text = ""
+            for i, word in enumerate(self._words(prompt)):
+                time.sleep(self.token_delay)
+                delta = word if i == 0 else " " + word
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await asyncio.to_thread(self.complete, prompt, formatted, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen():
+            text = ""
+            for i, word in enumerate(self._words(prompt)):
+                await asyncio.sleep(self.token_delay)
+                delta = word if i == 0 else " " + word
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+
+def llm_options_from_env(backend):
+    """
+    Read the settings of `backend` from environment variables.
+    """
+    if backend == "gemini":
+        return {"api_key": os.getenv("GOOGLE_API_KEY")}
+    if backend == "llamacpp":
+        return {
+            "model_path": os.getenv("LLAMACPP_MODEL_PATH"),
+            # 0 means every core
+            "n_threads": int(os.getenv("LLAMACPP_THREADS", "0")) or None,
+            "context_window": int(os.getenv("LLAMACPP_CONTEXT_SIZE", "4096")),
+            "max_new_tokens": int(os.getenv("LLAMACPP_MAX_NEW_TOKENS", "256")),
+        }
+    if backend == "stub":
+        return {
+            "max_new_tokens": int(os.getenv("STUB_MAX_NEW_TOKENS", "64")),
+            "token_delay": float(os.getenv("STUB_TOKEN_DELAY", "0")),
+        }
+    return {}
+
+
+def make_llm(backend, **options):
+    """
+    Create the LLM for `backend`; options are passed to that backend's factory.
+    """
+    if backend == "gemini":
+        return make_gemini_llm(**options)
+    if backend == "llamacpp":
+        return make_llamacpp_llm(**options)
+    if backend == "stub":
+        return StubLLM(**options)
+    raise ValueError(f"Unknown LLM backend: {backend!r} (expected one of {', '.join(LLM_BACKENDS)})")
+
+
+def make_embed_model(backend, api_key=None, model_name=None):
+    """
+    Create the embedding model for `backend`.
+
+    model_name is a Hugging Face model id or a local directory for the
+    huggingface backend; the gemini backend always uses embedding-001.
+    """
+    if backend == "gemini":
+        from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+        return GoogleGenAIEmbedding(model_name="models/embedding-001", api_key=api_key)
+    if backend == "huggingface":
+        try:
+            from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        except ImportError as e:
+            raise ImportError(
+                "EMBED_BACKEND=huggingface needs: pip install llama-index-embeddings-huggingface"
+            ) from e
+        return HuggingFaceEmbedding(model_name=model_name or "BAAI/bge-small-en-v1.5", device="cpu")
+    raise ValueError(f"Unknown embedding backend: {backend!r} (expected one of {', '.join(EMBED_BACKENDS)})")
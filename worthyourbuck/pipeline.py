@@ -0,0 +1,84 @@
+"""
+Factories for the WorthYourBuck retrieval-plus-synthesis pipeline.
+
+main.py builds every collection's chunks and query engine with these, and the
+offline tools (benchmark.py, calibrate_extractive.py) call the same functions,
+so they measure exactly the pipeline the service runs. The settings they use
+live in pipeline_settings.py.
+"""
+
+import threading
+
+import Stemmer
+from llama_index.core import SimpleDirectoryReader, get_response_synthesizer
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.retrievers.bm25 import BM25Retriever
+
+from pipeline_settings import CHUNK_OVERLAP, CHUNK_SIZE, SIMILARITY_TOP_K
+
+
+class ThreadSafeBM25Retriever(BM25Retriever):
+    """
+    BM25Retriever that gives every thread its own PyStemmer stemmer.
+    Questions are retrieved in worker threads, concurrently on one cached
+    collection, but BM25Retriever stems every query with a single Stemmer
+    object, which is not thread-safe. The index itself is only read.
+    """
+
+    @property
+    def stemmer(self):
+        local = self.__dict__.setdefault("_stemmers", threading.local())
+        stemmer = getattr(local, "stemmer", None)
+        if stemmer is None:
+            stemmer = local.stemmer = Stemmer.Stemmer("english")
+        return stemmer
+
+    @stemmer.setter
+    def stemmer(self, value):
+        # The stemmer handed to __init__ only serves the thread that built the retriever
+        self.__dict__.setdefault("_stemmers", threading.local()).stemmer = value
+
+
+def load_pdf_nodes(file_paths):
+    """
+    Read PDFs and split them into the pipeline's chunks.
+    """
+    docs = SimpleDirectoryReader(input_files=list(file_paths)).load_data()
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.get_nodes_from_documents(docs)
+
+
+def build_bm25_retriever(nodes):
+    """
+    Build the BM25 retriever over a set of chunks.
+    """
+    # bm25s refuses to return more hits than there are chunks
+    return ThreadSafeBM25Retriever.from_defaults(
+        nodes=nodes,
+        similarity_top_k=min(SIMILARITY_TOP_K, len(nodes))
+    )
+
+
+def load_bm25_retriever(persist_dir):
+    """
+    Restore a BM25 retriever saved with its persist() method.
+    """
+    return ThreadSafeBM25Retriever.from_persist_dir(persist_dir)
+
+
+def build_synthesizer(llm=None, streaming=False):
+    """
+    Create the pipeline's compact response synthesizer; `llm` defaults to Settings.llm.
+    """
+    return get_response_synthesizer(llm=llm, response_mode="compact", streaming=streaming)
+
+
+def build_query_engine(bm25, llm=None, streaming=False):
+    """
+    Combine a BM25 retriever with the pipeline's response synthesizer.
+    """
+    return RetrieverQueryEngine(
+        retriever=bm25,
+        response_synthesizer=build_synthesizer(llm=llm, streaming=streaming)
+    )
@@ -0,0 +1,12 @@
+"""
+Chunking and retrieval settings of the WorthYourBuck pipeline.
+
+The factories in pipeline.py build every collection with these, for main.py
+and the offline tools (benchmark.py, calibrate_extractive.py) alike.
+"""
+
+# SentenceSplitter chunk size and overlap, in tokens
+CHUNK_SIZE = 750
+CHUNK_OVERLAP = 150
+# Chunks retrieved by BM25 per question
+SIMILARITY_TOP_K = 3